@@ -0,0 +1,116 @@
+import json
+import random
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+####### CONSTS
+
+API_PATH = "/w/api.php"
+
+
+class FakeWikidataServer(object):
+    """
+    Local stand-in for the wbgetentities action of the wikidata API. Every id gets the label
+    "<language>-<id>" for each requested language. It can simulate latency and failures, and it
+    counts the requests it receives.
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0, retry_after=None, host="127.0.0.1", port=0, seed=1):
+        """
+
+        :param latency: seconds to wait before answering each request
+        :param failure_rate: probability (0..1) of answering a request with HTTP 503
+        :param retry_after: if not None, seconds sent in the Retry-After header of the failed answers
+        :param host: interface to listen on
+        :param port: port to listen on. 0 chooses a free one
+        :param seed: seed for the failures, so runs are reproducible
+        """
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._build_handler())
+        self._server.daemon_threads = True
+        self._thread = None
+        self.reset_counters()
+
+    @property
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return "http://{}:{}{}".format(host, port, API_PATH)
+
+    def reset_counters(self):
+        with self._lock:
+            self.requests = 0
+            self.failed_requests = 0
+            self.requested_ids = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def _should_fail(self):
+        with self._lock:
+            self.requests += 1
+            fail = self._random.random() < self.failure_rate
+            if fail:
+                self.failed_requests += 1
+            return fail
+
+    def _count_ids(self, n_ids):
+        with self._lock:
+            self.requested_ids += n_ids
+
+    def _build_handler(self):
+        fake_server = self
+
+        class _Handler(BaseHTTPRequestHandler):
+
+            def do_GET(self):
+                if fake_server.latency > 0:
+                    time.sleep(fake_server.latency)
+                if fake_server._should_fail():
+                    self._answer(status=503, body=b"Service unavailable", content_type="text/plain",
+                                 retry_after=fake_server.retry_after)
+                    return
+                params = parse_qs(urlparse(self.path).query)
+                ids = params.get("ids", [""])[0].split("|")
+                languages = params.get("languages", ["en"])[0].split("|")
+                fake_server._count_ids(len(ids))
+                entities = {}
+                for an_id in ids:
+                    entities[an_id] = {"id": an_id,
+                                       "labels": {a_language: {"language": a_language,
+                                                               "value": "{}-{}".format(a_language, an_id)}
+                                                  for a_language in languages}}
+                self._answer(status=200,
+                             body=json.dumps({"entities": entities, "success": 1}).encode("utf-8"),
+                             content_type="application/json")
+
+            def _answer(self, status, body, content_type, retry_after=None):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                if retry_after is not None:
+                    self.send_header("Retry-After", str(retry_after))
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Keep benchmark output clean
+
+        return _Handler
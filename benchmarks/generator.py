@@ -0,0 +1,111 @@
+import random
+
+from wlighter import SHEXC_FORMAT, TURTLE_FORMAT
+
+####### CONSTS
+
+DEFAULT_SEED = 1
+
+###### PRIVATE MEMBERS
+
+_ENTITY = "http://www.wikidata.org/entity/"
+_PROP_DIRECT = "http://www.wikidata.org/prop/direct/"
+_PROP_INDIRECT = "http://www.wikidata.org/prop/"
+
+_SHEXC_PREFIX_TEMPLATE = "PREFIX {}: <{}>"
+_TURTLE_PREFIX_TEMPLATE = "@prefix {}: <{}> ."
+_WIKIDATA_PREFIXES = [("wd", _ENTITY), ("wdt", _PROP_DIRECT), ("p", _PROP_INDIRECT)]
+_EXTRA_NAMESPACE_TEMPLATE = "http://example.org/ns{}/"
+
+_SHAPE_SIZE = 8  # Triple constraints per shape in ShExC
+
+
+class InputGenerator(object):
+    """
+    Synthetic ShExC/Turtle content mentioning wikidata entities and properties.
+    """
+
+    def __init__(self, format=SHEXC_FORMAT, n_lines=10000, n_distinct_ids=1000, prefixed_ratio=0.8,
+                 n_prefix_lines=5, seed=DEFAULT_SEED):
+        """
+
+        :param format: SHEXC_FORMAT or TURTLE_FORMAT
+        :param n_lines: approximate number of lines to generate
+        :param n_distinct_ids: number of distinct ids to use. Half of them are entities (QXX) and half properties (PXX)
+        :param prefixed_ratio: proportion of mentions written as prefixed names (wd:Q42). The rest are full IRIs
+        :param n_prefix_lines: number of PREFIX / @prefix lines. The first three bind the wikidata namespaces. If
+                lower than 3, the remaining wikidata namespaces are unbound and always written as full IRIs
+        :param seed: seed for the random choices, so the same parameters produce the same content
+        """
+        if format not in (SHEXC_FORMAT, TURTLE_FORMAT):
+            raise ValueError("Unsupported format: " + str(format))
+        self._format = format
+        self._n_lines = n_lines
+        self._n_distinct_ids = max(n_distinct_ids, 2)
+        self._prefixed_ratio = prefixed_ratio
+        self._n_prefix_lines = n_prefix_lines
+        self._random = random.Random(seed)
+
+        self._bound_prefixes = {}  # namespace --> prefix
+
+    def write(self, out_file):
+        with open(out_file, "w", encoding="utf-8") as out_stream:
+            for a_line in self.yield_lines():
+                out_stream.write(a_line + "\n")
+
+    def generate(self):
+        return "\n".join(self.yield_lines())
+
+    def yield_lines(self):
+        self._bound_prefixes = {}
+        for a_line in self._yield_prefix_lines():
+            yield a_line
+        yield ""
+        body_lines = self._n_lines - self._n_prefix_lines - 1
+        if self._format == SHEXC_FORMAT:
+            for a_line in self._yield_shexc_body(body_lines):
+                yield a_line
+        else:
+            for a_line in self._yield_turtle_body(body_lines):
+                yield a_line
+
+    def _yield_prefix_lines(self):
+        template = _SHEXC_PREFIX_TEMPLATE if self._format == SHEXC_FORMAT else _TURTLE_PREFIX_TEMPLATE
+        for i in range(self._n_prefix_lines):
+            if i < len(_WIKIDATA_PREFIXES):
+                prefix, namespace = _WIKIDATA_PREFIXES[i]
+                self._bound_prefixes[namespace] = prefix
+            else:
+                prefix, namespace = "ns" + str(i), _EXTRA_NAMESPACE_TEMPLATE.format(i)
+            yield template.format(prefix, namespace)
+
+    def _yield_shexc_body(self, body_lines):
+        written = 0
+        shape_counter = 0
+        while written < body_lines:
+            yield "<Shape{}> {{".format(shape_counter)
+            written += 1
+            for _ in range(min(_SHAPE_SIZE, body_lines - written)):
+                yield "  {} [{}] ;".format(self._random_prop(), self._random_entity())
+                written += 1
+            yield "}"
+            written += 1
+            shape_counter += 1
+
+    def _yield_turtle_body(self, body_lines):
+        for _ in range(body_lines):
+            yield "{} {} {} .".format(self._random_entity(), self._random_prop(), self._random_entity())
+
+    def _random_entity(self):
+        return self._mention(namespace=_ENTITY,
+                             an_id="Q" + str(self._random.randrange(1, self._n_distinct_ids // 2 + 1)))
+
+    def _random_prop(self):
+        namespace = _PROP_DIRECT if self._random.random() < 0.7 else _PROP_INDIRECT
+        return self._mention(namespace=namespace,
+                             an_id="P" + str(self._random.randrange(1, self._n_distinct_ids - self._n_distinct_ids // 2 + 1)))
+
+    def _mention(self, namespace, an_id):
+        if namespace in self._bound_prefixes and self._random.random() < self._prefixed_ratio:
+            return self._bound_prefixes[namespace] + ":" + an_id
+        return "<" + namespace + an_id + ">"
@@ -0,0 +1,164 @@
+import argparse
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+
+from wlighter import WLighter, SHEXC_FORMAT, TURTLE_FORMAT
+from benchmarks.generator import InputGenerator
+from benchmarks.fake_wikidata import FakeWikidataServer
+
+###### PRIVATE MEMBERS
+
+_METHODS = ["annotate_entities", "annotate_properties", "annotate_all"]
+_FORMATTERS = [("raw", False), ("rdfs", True)]
+_ROW_TEMPLATE = "{:<8} {:<20} {:<6} {:>10} {:>12} {:>12} {:>10} {:>9} {:>9}"
+
+
+class BenchmarkResult(object):
+
+    def __init__(self, format, method, formatter, seconds, lines, peak_memory, api_requests,
+                 api_failed_requests, api_ids, error=None):
+        self.format = format
+        self.method = method
+        self.formatter = formatter
+        self.seconds = seconds
+        self.lines = lines
+        self.peak_memory = peak_memory
+        self.api_requests = api_requests
+        self.api_failed_requests = api_failed_requests
+        self.api_ids = api_ids
+        self.error = error
+
+    @property
+    def lines_per_second(self):
+        return self.lines / self.seconds if self.seconds > 0 else float("inf")
+
+    def as_row(self):
+        if self.error is not None:
+            return "{:<8} {:<20} {:<6} FAILED: {}".format(self.format, self.method, self.formatter, self.error)
+        return _ROW_TEMPLATE.format(self.format,
+                                    self.method,
+                                    self.formatter,
+                                    "{:.3f}".format(self.seconds),
+                                    "{:.0f}".format(self.lines_per_second),
+                                    "{:.1f}".format(self.peak_memory / 1024 / 1024),
+                                    self.api_requests,
+                                    self.api_failed_requests,
+                                    self.api_ids)
+
+
+def run_benchmarks(server, work_dir, n_lines, n_distinct_ids, prefixed_ratio, n_prefix_lines,
+                   formats=(SHEXC_FORMAT, TURTLE_FORMAT), methods=_METHODS, formatters=_FORMATTERS,
+                   measure_memory=True, max_concurrent_calls=4):
+    """
+    It annotates synthetic inputs with every combination of format, annotate_* method and formatter,
+    using a fresh WLighter (with an empty cache) each time.
+
+    :return: list of BenchmarkResult
+    """
+    results = []
+    for a_format in formats:
+        input_file = os.path.join(work_dir, "input." + a_format)
+        InputGenerator(format=a_format,
+                       n_lines=n_lines,
+                       n_distinct_ids=n_distinct_ids,
+                       prefixed_ratio=prefixed_ratio,
+                       n_prefix_lines=n_prefix_lines).write(input_file)
+        out_file = os.path.join(work_dir, "output." + a_format)
+        for a_method in methods:
+            for formatter_name, rdfs_comments in formatters:
+                results.append(_run_one(server=server,
+                                        format=a_format,
+                                        method=a_method,
+                                        formatter_name=formatter_name,
+                                        rdfs_comments=rdfs_comments,
+                                        input_file=input_file,
+                                        out_file=out_file,
+                                        n_lines=n_lines,
+                                        measure_memory=measure_memory,
+                                        max_concurrent_calls=max_concurrent_calls))
+    return results
+
+
+def _run_one(server, format, method, formatter_name, rdfs_comments, input_file, out_file, n_lines,
+             measure_memory, max_concurrent_calls):
+    def annotate():
+        wlighter = WLighter(file_input=input_file,
+                            format=format,
+                            generate_rdfs_comments=rdfs_comments,
+                            api_url=server.url,
+                            max_concurrent_calls=max_concurrent_calls)
+        getattr(wlighter, method)(out_file=out_file, string_return=False)
+
+    try:
+        # Time and API usage are measured without tracemalloc, since it slows down the execution
+        server.reset_counters()
+        gc.collect()
+        start = time.perf_counter()
+        annotate()
+        seconds = time.perf_counter() - start
+        requests, failed_requests, ids = server.requests, server.failed_requests, server.requested_ids
+
+        peak_memory = 0
+        if measure_memory:
+            gc.collect()
+            tracemalloc.start()
+            annotate()
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+    except Exception as e:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        return BenchmarkResult(format, method, formatter_name, 0, n_lines, 0, 0, 0, 0,
+                               error="{}: {}".format(type(e).__name__, e))
+    return BenchmarkResult(format=format,
+                           method=method,
+                           formatter=formatter_name,
+                           seconds=seconds,
+                           lines=n_lines,
+                           peak_memory=peak_memory,
+                           api_requests=requests,
+                           api_failed_requests=failed_requests,
+                           api_ids=ids)
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="wLighter benchmarks against a local fake wikidata API")
+    arg_parser.add_argument("--lines", type=int, default=100000, help="lines of each generated input")
+    arg_parser.add_argument("--ids", type=int, default=5000, help="distinct wikidata ids in each input")
+    arg_parser.add_argument("--prefixed-ratio", type=float, default=0.8,
+                            help="proportion of mentions written as prefixed names instead of full IRIs")
+    arg_parser.add_argument("--prefix-lines", type=int, default=5, help="number of PREFIX / @prefix lines")
+    arg_parser.add_argument("--latency", type=float, default=0.05, help="seconds of latency of each API request")
+    arg_parser.add_argument("--failure-rate", type=float, default=0.0,
+                            help="probability of an API request failing with HTTP 503")
+    arg_parser.add_argument("--retry-after", type=float, default=None,
+                            help="seconds sent in the Retry-After header of the failed requests")
+    arg_parser.add_argument("--concurrency", type=int, default=4, help="max concurrent API requests")
+    arg_parser.add_argument("--formats", default=",".join([SHEXC_FORMAT, TURTLE_FORMAT]),
+                            help="comma separated formats to benchmark")
+    arg_parser.add_argument("--no-memory", action="store_true", help="do not measure peak memory (faster)")
+    args = arg_parser.parse_args()
+
+    with FakeWikidataServer(latency=args.latency, failure_rate=args.failure_rate,
+                            retry_after=args.retry_after) as server, \
+            tempfile.TemporaryDirectory() as work_dir:
+        results = run_benchmarks(server=server,
+                                 work_dir=work_dir,
+                                 n_lines=args.lines,
+                                 n_distinct_ids=args.ids,
+                                 prefixed_ratio=args.prefixed_ratio,
+                                 n_prefix_lines=args.prefix_lines,
+                                 formats=args.formats.split(","),
+                                 measure_memory=not args.no_memory,
+                                 max_concurrent_calls=args.concurrency)
+    print(_ROW_TEMPLATE.format("format", "method", "output", "seconds", "lines/s", "peak MiB",
+                               "requests", "failed", "ids"))
+    for a_result in results:
+        print(a_result.as_row())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,4 @@
-from distutils.core import setup
+from setuptools import setup
 setup(
   name = 'wlighter',
   packages = ['wlighter'],
@@ -13,6 +13,12 @@ setup(
   install_requires=[         
           'requests'
       ],
+  extras_require={
+          'async': ['aiohttp']
+      },
+  entry_points={
+          'console_scripts': ['wlighter=wlighter.cli:main']
+      },
   classifiers=[
     'Development Status :: 4 - Beta',     
     'Intended Audience :: Developers',      
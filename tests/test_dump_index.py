@@ -0,0 +1,112 @@
+import bz2
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from benchmarks.fake_wikidata import FakeWikidataServer
+from wlighter import WLighter, NTRIPLES_FORMAT
+from wlighter.dump_index import build_label_index, LabelIndex
+from wlighter.labels import NO_LABEL
+
+
+def _entity(an_id, labels):
+    return {"type": "item" if an_id[0] == "Q" else "property",
+            "id": an_id,
+            "labels": {a_language: {"language": a_language, "value": a_value}
+                       for a_language, a_value in labels.items()},
+            "claims": {"P31": [{"mainsnak": {"datavalue": {"value": {"id": "Q5"}}}}]}}
+
+
+class LabelIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        # Q and P ids with the same number, consecutive numbers (colliding slots) and big numbers
+        self._entities = [_entity("Q{}".format(number), {"en": "entity {}".format(number),
+                                                         "es": "entidad {}".format(number)})
+                          for number in list(range(1, 300)) + [123456789]]
+        self._entities += [_entity("P{}".format(number), {"en": "property {}".format(number)})
+                           for number in range(1, 50)]
+        self._entities += [_entity("Q900", {"fr": "seulement français"}),
+                           _entity("L7", {"en": "lexeme"})]
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_every_id_is_found(self):
+        index = self._build("dump.json", ["es"])
+        try:
+            self.assertEqual(len(self._entities) - 2, len(index))  # Q900 has no label in es/en, L7 is a lexeme
+            self.assertEqual("es|en", index.languages_key)
+            for number in list(range(1, 300)) + [123456789]:
+                self.assertEqual("entidad {}".format(number), index.get_label("Q{}".format(number)))
+            for number in range(1, 50):
+                self.assertEqual("property {}".format(number), index.get_label("P{}".format(number)))
+        finally:
+            index.close()
+
+    def test_missing_ids_are_not_found(self):
+        index = self._build("dump.json", ["en"])
+        try:
+            for an_id in ("Q300", "P50", "Q900", "L7", "Q0", "X1", "Q12a"):
+                self.assertIsNone(index.get_label(an_id))
+            self.assertEqual({"Q1": "entity 1"}, index.get_labels(["Q1", "Q300"]))
+        finally:
+            index.close()
+
+    def test_compressed_dumps(self):
+        for name in ("dump.json.gz", "dump.json.bz2"):
+            index = self._build(name, ["en"])
+            try:
+                self.assertEqual("entity 42", index.get_label("Q42"))
+            finally:
+                index.close()
+
+    def test_empty_index(self):
+        self._entities = []
+        index = self._build("dump.json", ["en"])
+        try:
+            self.assertEqual(0, len(index))
+            self.assertIsNone(index.get_label("Q1"))
+        finally:
+            index.close()
+
+    def test_other_files_are_rejected(self):
+        path = os.path.join(self._dir, "not_an_index")
+        with open(path, "wb") as out_stream:
+            out_stream.write(b"\0" * 64)
+        with self.assertRaises(ValueError):
+            LabelIndex(path)
+
+    def test_annotation_does_not_call_the_api(self):
+        self._build("dump.json", ["en"]).close()
+        with FakeWikidataServer() as server:
+            result = WLighter(raw_input="<http://www.wikidata.org/entity/Q42> "
+                                        "<http://www.wikidata.org/prop/direct/P31> "
+                                        "<http://www.wikidata.org/entity/Q900> .",
+                              format=NTRIPLES_FORMAT,
+                              label_index=os.path.join(self._dir, "dump.json.wlidx"),
+                              api_url=server.url).annotate_all()
+            self.assertEqual(0, server.requests)
+        self.assertIn("Q42  -->  entity 42", result)
+        self.assertIn("P31  -->  property 31", result)
+        self.assertIn("Q900  -->  " + NO_LABEL, result)
+
+    def _build(self, name, languages):
+        dump_path = os.path.join(self._dir, name)
+        content = "[\n" + ",\n".join(json.dumps(an_entity) for an_entity in self._entities) + "\n]\n"
+        opener = gzip.open if name.endswith(".gz") else bz2.open if name.endswith(".bz2") else open
+        with opener(dump_path, "wt", encoding="utf-8") as out_stream:
+            out_stream.write(content)
+        index_path = dump_path + ".wlidx"
+        build_label_index(dump_path=dump_path,
+                          index_path=index_path,
+                          languages=languages)
+        return LabelIndex(index_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from benchmarks.fake_wikidata import FakeWikidataServer
+from benchmarks.generator import InputGenerator
+from wlighter import WLighter, SHEXC_FORMAT, TURTLE_FORMAT, ANNOTATE_ALL, ANNOTATE_ENTITIES
+import wlighter.w_lighter as w_lighter_module
+
+# Declared in the middle of the content, so just the chunks after it know the prefix
+LATE_PREFIX_LINES = {TURTLE_FORMAT: ["@prefix late: <http://www.wikidata.org/entity/> .",
+                                     "late:Q4242 late:Q4343 late:Q4444 ."],
+                     SHEXC_FORMAT: ["PREFIX late: <http://www.wikidata.org/entity/>",
+                                    ":late { late:Q4242 [late:Q4343] }"]}
+
+
+class OutputEquivalenceTest(unittest.TestCase):
+    """
+    Parallel scans, streaming and batches must produce the same output as a regular annotation.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        cls._server = FakeWikidataServer().start()
+        cls._dir = tempfile.mkdtemp()
+        cls._paths = {}
+        for a_format, extension in ((TURTLE_FORMAT, ".ttl"), (SHEXC_FORMAT, ".shex")):
+            lines = list(InputGenerator(format=a_format, n_lines=3000, n_distinct_ids=400).yield_lines())
+            lines[len(lines) // 2:len(lines) // 2] = LATE_PREFIX_LINES[a_format]
+            path = os.path.join(cls._dir, "content" + extension)
+            with open(path, "w", encoding="utf-8") as out_stream:
+                out_stream.write("\n".join(lines) + "\n")
+            cls._paths[a_format] = path
+
+    @classmethod
+    def tearDownClass(cls):
+        cls._server.stop()
+        shutil.rmtree(cls._dir)
+
+    def test_parallel_scan(self):
+        for a_format, path in self._paths.items():
+            for target in (ANNOTATE_ALL, ANNOTATE_ENTITIES):
+                plain = self._wlighter(path, a_format)
+                expected = plain.annotate(target=target)
+                # Small chunks, so the content is split among several processes
+                with mock.patch.object(w_lighter_module, "_MIN_CHUNK_BYTES", 4096):
+                    wlig = self._wlighter(path, a_format, scan_processes=2)
+                    self.assertGreater(len(wlig._chunk_ranges()), 2)
+                    self.assertEqual(expected, wlig.annotate(target=target))
+                    self.assertEqual(plain.stats.lines_scanned, wlig.stats.lines_scanned)
+                    self.assertEqual(plain.stats.mentions_found, wlig.stats.mentions_found)
+                self.assertIn("Q4343  -->  en-Q4343", expected)
+
+    def test_streaming(self):
+        for a_format, path in self._paths.items():
+            for stream_window in (1, 7, 500, 100000):
+                # Comments aligned in the whole content can not be streamed: compare the modes that can
+                for alignment in ({"mode_column_aligned": False}, {"alignment_block_lines": 5}):
+                    expected = self._wlighter(path, a_format, **alignment).annotate_all()
+                    streamed = self._wlighter(path, a_format, stream_window=stream_window, **alignment)
+                    self.assertEqual(expected, streamed.annotate_all())
+                    self.assertEqual(expected.split("\n"), list(streamed.yield_annotated_lines()))
+
+    def test_stream_input(self):
+        for a_format, path in self._paths.items():
+            expected = self._wlighter(path, a_format).annotate_all()
+            with open(path, encoding="utf-8") as in_stream:
+                self.assertEqual(expected, WLighter(stream_input=in_stream,
+                                                    format=a_format,
+                                                    api_url=self._server.url).annotate_all())
+
+    def test_batches(self):
+        for processes in (None, 2):
+            for a_format, path in self._paths.items():
+                expected = self._wlighter(path, a_format).annotate_all()
+                wlig = WLighter(format=a_format, api_url=self._server.url)
+                self.assertEqual([expected], list(wlig.yield_many_annotated(paths=[path], processes=processes)))
+                out_dir = os.path.join(self._dir, "out_{}".format(processes))
+                [out_file] = wlig.annotate_many(paths=[path], out_dir=out_dir, processes=processes)
+                with open(out_file, encoding="utf-8") as in_stream:
+                    self.assertEqual(expected + "\n", in_stream.read())
+
+    def _wlighter(self, path, a_format, **kwargs):
+        return WLighter(file_input=path,
+                        format=a_format,
+                        api_url=self._server.url,
+                        **kwargs)
+
+
+if __name__ == "__main__":
+    unittest.main()
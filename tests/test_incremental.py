@@ -0,0 +1,149 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from benchmarks.fake_wikidata import FakeWikidataServer
+from wlighter import WLighter, SHEXC_FORMAT, TURTLE_FORMAT
+from wlighter.labels import NO_LABEL
+from wlighter.manifest import manifest_path_of
+
+SHEX_SCHEMA = """PREFIX wd: <http://www.wikidata.org/entity/>
+PREFIX wdt: <http://www.wikidata.org/prop/direct/>
+PREFIX xsd: <http://www.w3.org/2001/XMLSchema#>
+
+:human {
+  wdt:P31 [wd:Q5] ;
+  wdt:P21 [wd:Q6581097 wd:Q6581072] ;
+  wdt:P735 xsd:string ;
+  wdt:P19 @:city *
+}
+
+:city {
+  wdt:P31 [wd:Q515] ;
+  wdt:P17 [wd:Q29]
+}"""
+
+TURTLE_GRAPH = """@prefix wd: <http://www.wikidata.org/entity/> .
+@prefix wdt: <http://www.wikidata.org/prop/direct/> .
+
+wd:Q42 wdt:P31 wd:Q5 .
+wd:Q42 wdt:P19 wd:Q350 ."""
+
+
+class IncrementalAnnotationTest(unittest.TestCase):
+
+    def setUp(self):
+        self._server = FakeWikidataServer().start()
+        self._dir = tempfile.mkdtemp()
+        self._source = self._write("schema.shex", SHEX_SCHEMA)
+        self._out = os.path.join(self._dir, "schema_annotated.shex")
+
+    def tearDown(self):
+        self._server.stop()
+        shutil.rmtree(self._dir)
+
+    def test_first_run_matches_regular_annotation(self):
+        expected = self._wlighter(self._source, incremental=False).annotate_all()
+        self.assertEqual(expected, self._wlighter(self._source).annotate_all(out_file=self._out))
+        self.assertTrue(os.path.isfile(manifest_path_of(self._out)))
+
+    def test_unchanged_input_is_skipped(self):
+        first = self._wlighter(self._source).annotate_all(out_file=self._out)
+        self._server.reset_counters()
+        wlig = self._wlighter(self._source)
+        self.assertEqual(first, wlig.annotate_all(out_file=self._out))
+        self.assertTrue(wlig.stats.skipped)
+        self.assertEqual(0, self._server.requests)
+
+    def test_annotating_in_place_does_not_duplicate_annotations(self):
+        for rdfs_comments in (False, True):
+            expected = self._wlighter(self._source, incremental=False,
+                                      generate_rdfs_comments=rdfs_comments).annotate_all()
+            in_place = self._write("in_place.shex", SHEX_SCHEMA)
+            for _ in range(3):
+                if os.path.isfile(manifest_path_of(in_place)):  # Without it, annotations must be recognised
+                    os.remove(manifest_path_of(in_place))
+                self._wlighter(in_place, generate_rdfs_comments=rdfs_comments).annotate_all(out_file=in_place)
+                self.assertEqual(expected + "\n", self._read(in_place))
+
+    def test_labels_of_unchanged_lines_are_reused(self):
+        self._wlighter(self._source).annotate_all(out_file=self._out)
+        self._write("schema.shex", SHEX_SCHEMA.replace("wdt:P735 xsd:string", "wdt:P734 xsd:string"))
+        self._server.reset_counters()
+        result = self._wlighter(self._source).annotate_all(out_file=self._out)
+        self.assertEqual(1, self._server.requested_ids)  # Just P734, the only new id
+        self.assertIn("P734  -->  en-P734", result)
+        self.assertEqual(self._wlighter(self._source, incremental=False).annotate_all(), result)
+
+    def test_changed_settings_solve_every_id_again(self):
+        self._wlighter(self._source).annotate_all(out_file=self._out)
+        self._server.reset_counters()
+        result = self._wlighter(self._source, languages=["es"]).annotate_all(out_file=self._out)
+        self.assertGreater(self._server.requests, 0)
+        self.assertNotIn("en-", result)
+        self.assertIn("P31  -->  es-P31", result)
+
+    def test_inline_labels_are_not_trusted_without_manifest(self):
+        self._wlighter(self._source).annotate_all(out_file=self._out)
+        os.remove(manifest_path_of(self._out))
+        self._server.reset_counters()
+        result = self._wlighter(self._out, languages=["es"]).annotate_all(out_file=self._out)
+        self.assertGreater(self._server.requests, 0)
+        self.assertNotIn("en-", result)
+
+    def test_unsolved_ids_are_asked_again(self):
+        self._server.failure_rate = 1.0
+        wlig = self._wlighter(self._source, api_max_retries=1)
+        self.assertIn(NO_LABEL, wlig.annotate_all(out_file=self._out))
+        self.assertIn("Q5", wlig.stats.unsolved_ids)
+
+        self._server.failure_rate = 0.0
+        self._server.reset_counters()
+        wlig = self._wlighter(self._source)
+        result = wlig.annotate_all(out_file=self._out)
+        self.assertFalse(wlig.stats.skipped)
+        self.assertGreater(self._server.requests, 0)
+        self.assertNotIn(NO_LABEL, result)
+
+        self._server.reset_counters()
+        wlig = self._wlighter(self._source)
+        wlig.annotate_all(out_file=self._out)
+        self.assertTrue(wlig.stats.skipped)
+        self.assertEqual(0, self._server.requests)
+
+    def test_rdfs_prefix_is_declared_once_in_turtle(self):
+        graph = self._write("graph.ttl", TURTLE_GRAPH)
+        for _ in range(3):
+            self._wlighter(graph, format=TURTLE_FORMAT, generate_rdfs_comments=True).annotate_all(out_file=graph)
+        content = self._read(graph)
+        self.assertEqual(1, content.count("rdf-schema#>"))
+        self.assertEqual(2, content.count("rdfs:comment"))
+
+    def test_annotation_order_is_stable(self):
+        first = self._wlighter(self._source).annotate_all(out_file=self._out)
+        os.remove(manifest_path_of(self._out))
+        shutil.copy(self._out, self._source)
+        # Without manifest nothing is reused, but every line keeps its mentions in order of appearance
+        self.assertEqual(first, self._wlighter(self._source).annotate_all(out_file=self._out))
+
+    def _wlighter(self, file_input, incremental=True, format=SHEXC_FORMAT, **kwargs):
+        return WLighter(file_input=file_input,
+                        format=format,
+                        incremental=incremental,
+                        api_url=self._server.url,
+                        **kwargs)
+
+    def _write(self, name, content):
+        path = os.path.join(self._dir, name)
+        with open(path, "w", encoding="utf-8") as out_stream:
+            out_stream.write(content)
+        return path
+
+    def _read(self, path):
+        with open(path, encoding="utf-8") as in_stream:
+            return in_stream.read()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+import pickle
+import unittest
+
+from wlighter.mentions import MentionIndex
+
+
+def _index_of(lines):
+    result = MentionIndex()
+    for line_number, mentions in lines:
+        result.add_line(line_number, mentions)
+    return result
+
+
+class MentionIndexTest(unittest.TestCase):
+
+    def test_lines_keep_their_mentions(self):
+        index = _index_of([(0, ["Q1", "P31"]), (4, ["Q5"]), (9, ["P31", "Q1", "Q7"])])
+        self.assertEqual(["Q1", "P31"], index.mentions_of(0))
+        self.assertEqual([], index.mentions_of(1))
+        self.assertEqual(["P31", "Q1", "Q7"], index.mentions_of(9))
+        self.assertEqual([], index.mentions_of(10))
+        self.assertEqual(["Q1", "P31", "Q5", "Q7"], index.ids)
+        self.assertEqual(6, index.n_mentions)
+        self.assertEqual(3, len(index))
+
+    def test_extend_shifts_lines_and_offsets(self):
+        first = _index_of([(0, ["Q1", "P31"]), (2, ["Q5"])])
+        second = _index_of([(1, ["Q5", "Q8"]), (3, ["P31"])])
+        third = MentionIndex()
+        fourth = _index_of([(0, ["Q9"])])
+        first.extend(other=second, line_offset=3)
+        first.extend(other=third, line_offset=10)
+        first.extend(other=fourth, line_offset=10)
+        self.assertEqual([(0, ["Q1", "P31"]), (2, ["Q5"]), (4, ["Q5", "Q8"]), (6, ["P31"]), (10, ["Q9"])],
+                         list(first.yield_line_mentions()))
+        self.assertEqual(["Q1", "P31", "Q5", "Q8", "Q9"], first.ids)
+        self.assertEqual(7, first.n_mentions)
+        self.assertEqual(["Q5", "Q8"], first.mentions_of(4))
+        self.assertEqual([], first.mentions_of(1))
+
+    def test_extend_equals_adding_every_line(self):
+        lines = [(number, ["Q{}".format(number % 7), "P{}".format(number % 3)]) for number in range(0, 100, 3)]
+        expected = _index_of(lines)
+        merged = MentionIndex()
+        for start in range(0, 100, 25):
+            merged.extend(other=_index_of([(number - start, mentions) for number, mentions in lines
+                                           if start <= number < start + 25]),
+                          line_offset=start)
+        self.assertEqual(list(expected.yield_line_mentions()), list(merged.yield_line_mentions()))
+        self.assertEqual(sorted(expected.ids), sorted(merged.ids))
+
+    def test_it_can_be_pickled(self):
+        # Indexes travel between the processes scanning chunks in parallel
+        index = _index_of([(0, ["Q1"]), (3, ["Q2", "P31"])])
+        self.assertEqual(list(index.yield_line_mentions()),
+                         list(pickle.loads(pickle.dumps(index)).yield_line_mentions()))
+
+
+if __name__ == "__main__":
+    unittest.main()
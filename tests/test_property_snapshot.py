@@ -0,0 +1,76 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from wlighter.property_snapshot import build_property_snapshot, PropertySnapshot
+
+
+def _property(number, labels):
+    return {"type": "property",
+            "id": "P{}".format(number),
+            "labels": {a_language: {"language": a_language, "value": a_value}
+                       for a_language, a_value in labels.items()}}
+
+
+class PropertySnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self._dir = tempfile.mkdtemp()
+        # Enough labels for several compressed blocks. Even properties share their Spanish label
+        entities = [_property(number, {"en": "property {}".format(number),
+                                       "es": "propiedad {}".format(number if number % 2 else "par")})
+                    for number in range(1, 1000)]
+        entities += [_property(5000, {"fr": "seulement français"}),
+                     {"type": "item", "id": "Q1", "labels": {"en": {"language": "en", "value": "entity"}}}]
+        self._dump_path = os.path.join(self._dir, "dump.json")
+        with open(self._dump_path, "w", encoding="utf-8") as out_stream:
+            out_stream.write("[\n" + ",\n".join(json.dumps(an_entity) for an_entity in entities) + "\n]\n")
+        self._snapshot_path = os.path.join(self._dir, "properties.wlprops")
+
+    def tearDown(self):
+        shutil.rmtree(self._dir)
+
+    def test_every_label_is_found(self):
+        self.assertEqual(999, build_property_snapshot(self._snapshot_path, ["es"], dump_path=self._dump_path))
+        snapshot = PropertySnapshot(self._snapshot_path)
+        try:
+            self.assertEqual(["es", "en"], snapshot.languages)
+            # Backwards, so blocks are decompressed again after being dropped
+            for number in reversed(range(1, 1000)):
+                an_id = "P{}".format(number)
+                self.assertEqual("propiedad {}".format(number if number % 2 else "par"),
+                                 snapshot.get_label(an_id, ["es"]))
+                self.assertEqual("property {}".format(number), snapshot.get_label(an_id, ["fr"]))
+            for an_id in ("P5000", "P1000", "P0", "Q1", "L1", "P12a"):
+                self.assertIsNone(snapshot.get_label(an_id, ["es"]))
+            self.assertEqual({"P1": "propiedad 1"}, snapshot.get_labels(["P1", "Q1", "P5000"], ["es"]))
+        finally:
+            snapshot.close()
+
+    def test_covers(self):
+        build_property_snapshot(self._snapshot_path, ["es"], dump_path=self._dump_path)
+        snapshot = PropertySnapshot(self._snapshot_path)
+        try:
+            self.assertTrue(snapshot.covers(["es"]))
+            self.assertTrue(snapshot.covers([]))
+            self.assertFalse(snapshot.covers(["es", "fr"]))
+        finally:
+            snapshot.close()
+
+    def test_labels_are_compressed(self):
+        build_property_snapshot(self._snapshot_path, ["es"], dump_path=self._dump_path)
+        raw_labels_size = sum(len("property {}".format(number)) + len("propiedad {}".format(number))
+                              for number in range(1, 1000))
+        self.assertLess(os.path.getsize(self._snapshot_path), raw_labels_size)
+
+    def test_bad_magic(self):
+        with open(self._snapshot_path, "wb") as out_stream:
+            out_stream.write(b"WLPSN001" + bytes(64))
+        with self.assertRaises(ValueError):
+            PropertySnapshot(self._snapshot_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1 +1,3 @@
-from wlighter.w_lighter import WLighter, SHEXC_FORMAT, TURTLE_FORMAT
+from wlighter.w_lighter import WLighter, SHEXC_FORMAT, TURTLE_FORMAT, NTRIPLES_FORMAT, \
+    ANNOTATE_ENTITIES, ANNOTATE_PROPERTIES, ANNOTATE_ALL
+from wlighter.annotator import Annotator
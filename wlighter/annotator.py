@@ -0,0 +1,92 @@
+from wlighter.w_lighter import WLighter, SHEXC_FORMAT, ANNOTATE_ALL
+from wlighter.wikidata_api import DEFAULT_MAX_CONCURRENT_CALLS, DEFAULT_MAX_RETRIES, DEFAULT_MAXLAG
+from wlighter.label_cache import DEFAULT_CACHE_TTL, DEFAULT_CACHE_MAX_ENTRIES
+from wlighter.resolvers import ResolverChain, MemoryResolver, DEFAULT_MEMORY_ENTRIES
+
+####### CONSTS
+
+DEFAULT_LRU_SIZE = DEFAULT_MEMORY_ENTRIES
+
+
+class Annotator(object):
+    """
+    Long-lived annotator for services that annotate many small pieces of content. It is built once with
+    the settings (format, languages, ...), and then annotate() can be called as many times as needed,
+    from several threads at a time. Labels are kept in a bounded in-memory LRU shared by every call,
+    and calls needing the same unknown id at a time wait for a single request to wikidata instead of
+    sending one each.
+    """
+
+    def __init__(self, format=SHEXC_FORMAT, languages=None, generate_rdfs_comments=False,
+                 mode_column_aligned=True, lru_size=DEFAULT_LRU_SIZE, cache_file=None,
+                 cache_ttl=DEFAULT_CACHE_TTL, cache_max_entries=DEFAULT_CACHE_MAX_ENTRIES,
+                 max_concurrent_calls=DEFAULT_MAX_CONCURRENT_CALLS, label_index=None, api_url=None,
+                 stats_hook=None, api_max_retries=DEFAULT_MAX_RETRIES, api_maxlag=DEFAULT_MAXLAG,
+                 property_snapshot=None, alignment_block_lines=None):
+        """
+        Params have the same meaning as in WLighter, except:
+
+        :param lru_size: max number of labels kept in memory. The least recently used ones are discarded
+                first. Labels discarded are still in the label cache, if it is big enough
+        :param stats_hook: optional callable, called as in WLighter for the phases of each annotation.
+                It may be called from several threads at a time
+        """
+        if lru_size < 1:
+            raise ValueError("lru_size must be a positive integer")
+        self._format = format
+        self._languages = languages
+        self._generate_rdfs_comments = generate_rdfs_comments
+        self._mode_column_aligned = mode_column_aligned
+        self._alignment_block_lines = alignment_block_lines
+        self._stats_hook = stats_hook
+
+        # A WLighter with no content, used just to build the tiers of its resolver chain
+        self._backend = WLighter(format=format,
+                                 languages=languages,
+                                 cache_file=cache_file,
+                                 cache_ttl=cache_ttl,
+                                 cache_max_entries=cache_max_entries,
+                                 max_concurrent_calls=max_concurrent_calls,
+                                 label_index=label_index,
+                                 api_url=api_url,
+                                 api_max_retries=api_max_retries,
+                                 api_maxlag=api_maxlag,
+                                 property_snapshot=property_snapshot)
+        self._labels = MemoryResolver(max_entries=lru_size)
+        self._resolver_chain = ResolverChain(tiers=[self._labels] + self._backend.resolver_chain.tiers,
+                                             single_flight=True)
+
+    @property
+    def labels(self):
+        """
+        In-memory labels shared by every annotation. Check its hits and misses attributes to know how
+        useful it is being.
+        """
+        return self._labels
+
+    @property
+    def resolver_chain(self):
+        """
+        ResolverChain shared by every annotation: the in-memory labels followed by the tiers of a regular
+        WLighter. Check its shared_waits attribute and its tier_stats().
+        """
+        return self._resolver_chain
+
+    def annotate(self, text, target=ANNOTATE_ALL):
+        """
+        It annotates some content. Thread-safe.
+
+        :param text: content to be annotated, as a regular str
+        :param target: choose what to annotate. Use the consts ANNOTATE_ENTITIES, ANNOTATE_PROPERTIES or ANNOTATE_ALL
+        :return: the annotated content, as an str
+        """
+        return WLighter(raw_input=text,
+                        format=self._format,
+                        languages=self._languages,
+                        generate_rdfs_comments=self._generate_rdfs_comments,
+                        mode_column_aligned=self._mode_column_aligned,
+                        alignment_block_lines=self._alignment_block_lines,
+                        stats_hook=self._stats_hook,
+                        resolver_chain=self._resolver_chain).annotate(out_file=None,
+                                                                      string_return=True,
+                                                                      target=target)
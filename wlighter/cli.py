@@ -0,0 +1,165 @@
+import argparse
+import glob
+import os
+import sys
+
+from wlighter.w_lighter import WLighter, SHEXC_FORMAT, TURTLE_FORMAT, NTRIPLES_FORMAT, \
+    ANNOTATE_ENTITIES, ANNOTATE_PROPERTIES, ANNOTATE_ALL
+from wlighter.annotator import Annotator
+
+####### CONSTS
+
+STDIN_PATH = "-"
+
+###### PRIVATE MEMBERS
+
+_TARGETS = {"all": ANNOTATE_ALL,
+            "entities": ANNOTATE_ENTITIES,
+            "properties": ANNOTATE_PROPERTIES}
+
+
+def main(argv=None):
+    """
+    Entry point of the wlighter command. Run it with --help to see every option.
+
+    :param argv: list of command line arguments. sys.argv[1:] if None
+    :return:
+    """
+    arg_parser = _build_arg_parser()
+    args = arg_parser.parse_args(argv)
+    if args.jobs < 1:
+        arg_parser.error("-j/--jobs must be a positive integer")
+    try:
+        paths = _expand_paths(args.paths)
+        if args.out_dir is not None:
+            _annotate_to_dir(args, paths)
+        else:
+            _annotate_to_stdout(args, paths)
+    except BrokenPipeError:  # Output piped to a command that stopped reading it (head, for example)
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+    except (ValueError, OSError) as e:
+        arg_parser.error(str(e))
+
+
+def _build_arg_parser():
+    arg_parser = argparse.ArgumentParser(prog="wlighter",
+                                         description="Annotate the wikidata ids of ShExC, Turtle or N-Triples "
+                                                     "content with their labels")
+    arg_parser.add_argument("paths", nargs="*", default=[STDIN_PATH],
+                            help="files to annotate. Glob patterns (schemas/**/*.shex) are expanded. "
+                                 "Use - or nothing to read from stdin")
+    arg_parser.add_argument("-o", "--out-dir", default=None,
+                            help="directory where the annotated files are written, with the same names as their "
+                                 "inputs. If not provided, results are written to stdout")
+    arg_parser.add_argument("-f", "--format", default=SHEXC_FORMAT,
+                            choices=[SHEXC_FORMAT, TURTLE_FORMAT, NTRIPLES_FORMAT],
+                            help="format of the input. Default: " + SHEXC_FORMAT)
+    arg_parser.add_argument("-l", "--languages", default="en",
+                            help="comma separated list of preferred languages for the labels. English is used "
+                                 "when none of them is available. Default: en")
+    arg_parser.add_argument("-t", "--target", default="all", choices=sorted(_TARGETS),
+                            help="ids to annotate. Default: all")
+    arg_parser.add_argument("--rdfs-comments", action="store_true",
+                            help="generate rdfs:comments with // instead of regular comments with #")
+    arg_parser.add_argument("--no-align", action="store_true",
+                            help="place each comment a fixed amount of spaces far from its line instead of "
+                                 "starting all of them in the same column")
+    arg_parser.add_argument("--align-blocks", type=int, default=None, metavar="MAX_LINES",
+                            help="align the comments within each block of lines (ended by a blank line or after "
+                                 "MAX_LINES lines) instead of in the whole file")
+    arg_parser.add_argument("-j", "--jobs", type=int, default=1,
+                            help="number of processes used to annotate the files. Several files are scanned "
+                                 "and written at a time (to stdout, in the same order as given). A single file, "
+                                 "or files read with --stream-window or along with stdin, is split in chunks "
+                                 "scanned at a time. Default: 1")
+    arg_parser.add_argument("--cache-file", default=None,
+                            help="SQLite file to persist the labels obtained from wikidata between executions")
+    arg_parser.add_argument("--label-index", default=None,
+                            help="label index built from a wikidata dump (see wlighter.dump_index) to take the "
+                                 "labels from instead of the wikidata API")
+    arg_parser.add_argument("--property-snapshot", default=None,
+                            help="snapshot of property labels (see wlighter.property_snapshot)")
+    arg_parser.add_argument("--api-url", default=None,
+                            help="URL of the wikidata API (api.php). Default: the public wikidata endpoint")
+    arg_parser.add_argument("--stream-window", type=int, default=None,
+                            help="process the content in windows of this number of lines, writing each one "
+                                 "before reading the next. stdin is read line by line, so the output starts "
+                                 "before the input ends. Not used with --out-dir")
+    return arg_parser
+
+
+def _expand_paths(path_args):
+    result = []
+    for a_path_arg in path_args:
+        if a_path_arg == STDIN_PATH:
+            matches = [STDIN_PATH]
+        else:
+            matches = sorted(glob.glob(a_path_arg, recursive=True))
+            if len(matches) == 0:
+                raise ValueError("No file matches " + a_path_arg)
+        for a_path in matches:
+            if a_path not in result:
+                result.append(a_path)
+    return result
+
+
+def _annotate_to_dir(args, paths):
+    if STDIN_PATH in paths:
+        raise ValueError("stdin can not be annotated to an output directory. Remove --out-dir to write to stdout")
+    _batch_wlighter(args).annotate_many(paths=paths,
+                                        out_dir=args.out_dir,
+                                        target=_TARGETS[args.target],
+                                        processes=args.jobs if args.jobs > 1 else None)
+
+
+def _annotate_to_stdout(args, paths):
+    if args.jobs > 1 and len(paths) > 1 and STDIN_PATH not in paths and args.stream_window is None:
+        # Files are annotated in a pool of processes, and their results written as they come, in order
+        for a_result in _batch_wlighter(args).yield_many_annotated(paths=paths,
+                                                                   target=_TARGETS[args.target],
+                                                                   processes=args.jobs):
+            if a_result != "":  # Same output as writing the lines of each file to stdout
+                sys.stdout.write(a_result + "\n")
+        sys.stdout.flush()
+        return
+    # Labels are shared by every file, so ids repeated among them are solved just once
+    annotator = Annotator(format=args.format,
+                          languages=_languages_of(args),
+                          cache_file=args.cache_file,
+                          label_index=args.label_index,
+                          property_snapshot=args.property_snapshot,
+                          api_url=args.api_url)
+    for a_path in paths:
+        WLighter(stream_input=sys.stdin if a_path == STDIN_PATH else None,
+                 file_input=None if a_path == STDIN_PATH else a_path,
+                 format=args.format,
+                 languages=_languages_of(args),
+                 generate_rdfs_comments=args.rdfs_comments,
+                 mode_column_aligned=not args.no_align,
+                 alignment_block_lines=args.align_blocks,
+                 stream_window=args.stream_window,
+                 resolver_chain=annotator.resolver_chain,
+                 scan_processes=args.jobs if args.jobs > 1 else None).annotate(out_file=sys.stdout,
+                                                                              string_return=False,
+                                                                              target=_TARGETS[args.target])
+
+
+def _batch_wlighter(args):
+    return WLighter(format=args.format,
+                    languages=_languages_of(args),
+                    generate_rdfs_comments=args.rdfs_comments,
+                    mode_column_aligned=not args.no_align,
+                    alignment_block_lines=args.align_blocks,
+                    cache_file=args.cache_file,
+                    label_index=args.label_index,
+                    property_snapshot=args.property_snapshot,
+                    api_url=args.api_url)
+
+
+def _languages_of(args):
+    return [a_language.strip() for a_language in args.languages.split(",") if a_language.strip() != ""]
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,241 @@
+import argparse
+import bz2
+import gzip
+import json
+import mmap
+import os
+import struct
+import tempfile
+
+from wlighter.labels import build_languages_for_api, choose_label
+
+###### PRIVATE MEMBERS
+
+# Index layout (little endian):
+#   header:  magic (8 bytes) | n_slots (uint64) | n_labels (uint64) | languages length (uint64) | languages (utf-8)
+#   table:   n_slots x [key (uint64) | blob position (uint64)]. Key 0 means empty slot. Open addressing,
+#            linear probing
+#   blob:    per label, [length (uint16) | utf-8 bytes]
+_MAGIC = b"WLIDX001"
+_HEADER = struct.Struct("<8sQQQ")
+_SLOT = struct.Struct("<QQ")
+_LABEL_LENGTH = struct.Struct("<H")
+_PAIR = struct.Struct("<QQ")
+
+_MAX_LOAD_FACTOR = 0.7
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15  # Fibonacci hashing, ids are mostly consecutive numbers
+_UINT64_MASK = 0xFFFFFFFFFFFFFFFF
+
+_LABELS_KEY = '"labels":'
+_ID_KEY = '"id":'
+
+
+def build_label_index(dump_path, index_path, languages=None):
+    """
+    It streams a wikidata JSON dump (.json, .json.gz or .json.bz2), entity by entity, and writes an index
+    id --> label with the label chosen for the received languages. The index can be used later with
+    LabelIndex, so labels can be obtained without calling the wikidata API.
+
+    :param dump_path: disk path of the dump
+    :param index_path: disk path where the index will be written
+    :param languages: list with sorted preferred languages. ["en"] will be used if no value is provided
+    :return: number of labels indexed
+    """
+    languages = ["en"] if languages is None else languages
+    index_dir = os.path.dirname(os.path.abspath(index_path))
+    with tempfile.TemporaryFile(dir=index_dir) as blob_stream, \
+            tempfile.TemporaryFile(dir=index_dir) as pairs_stream:
+        n_labels = 0
+        blob_position = 0
+        for an_id, labels_json in yield_dump_entities(dump_path):
+            key = _encode_id(an_id)
+            if key is None:
+                continue  # Lexemes and other kinds of entities
+            label = choose_label(labels_entity_json=labels_json,
+                                 languages=languages)
+            if label is None:
+                continue
+            encoded_label = label.encode("utf-8")
+            blob_stream.write(_LABEL_LENGTH.pack(len(encoded_label)))
+            blob_stream.write(encoded_label)
+            pairs_stream.write(_PAIR.pack(key, blob_position))
+            blob_position += _LABEL_LENGTH.size + len(encoded_label)
+            n_labels += 1
+        _write_index(index_path=index_path,
+                     languages_key=build_languages_for_api(languages),
+                     n_labels=n_labels,
+                     blob_stream=blob_stream,
+                     blob_size=blob_position,
+                     pairs_stream=pairs_stream)
+    return n_labels
+
+
+class LabelIndex(object):
+    """
+    Read-only access to an index built with build_label_index. The file is memory-mapped, so it is
+    not loaded in RAM, and each lookup costs (on average) a constant number of reads.
+    """
+
+    def __init__(self, index_path):
+        self._index_path = index_path
+        self._stream = open(index_path, "rb")
+        self._mapped = mmap.mmap(self._stream.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._n_slots, self._n_labels, languages_length = _HEADER.unpack_from(self._mapped, 0)
+        if magic != _MAGIC:
+            self.close()
+            raise ValueError("The file is not a wLighter label index: " + index_path)
+        self._languages_key = self._mapped[_HEADER.size:_HEADER.size + languages_length].decode("utf-8")
+        self._table_start = _HEADER.size + languages_length
+        self._blob_start = self._table_start + self._n_slots * _SLOT.size
+
+    @property
+    def languages_key(self):
+        """
+        Chain of languages used to choose the labels of this index, in the API format ("es|fr|en")
+        """
+        return self._languages_key
+
+    def __len__(self):
+        return self._n_labels
+
+    def get_label(self, an_id):
+        """
+
+        :param an_id: wikidata id (QXX or PXX)
+        :return: its label, or None if the id is not in the index
+        """
+        key = _encode_id(an_id)
+        if key is None or self._n_slots == 0:
+            return None
+        slot = _slot_of(key, self._n_slots)
+        while True:
+            slot_key, blob_position = _SLOT.unpack_from(self._mapped, self._table_start + slot * _SLOT.size)
+            if slot_key == key:
+                label_start = self._blob_start + blob_position
+                label_length = _LABEL_LENGTH.unpack_from(self._mapped, label_start)[0]
+                label_start += _LABEL_LENGTH.size
+                return self._mapped[label_start:label_start + label_length].decode("utf-8")
+            if slot_key == 0:
+                return None
+            slot = (slot + 1) % self._n_slots
+
+    def get_labels(self, ids):
+        """
+
+        :param ids: iterable of wikidata ids
+        :return: dict id --> label containing just the ids found in the index
+        """
+        result = {}
+        for an_id in ids:
+            label = self.get_label(an_id)
+            if label is not None:
+                result[an_id] = label
+        return result
+
+    def close(self):
+        self._mapped.close()
+        self._stream.close()
+
+
+def _write_index(index_path, languages_key, n_labels, blob_stream, blob_size, pairs_stream):
+    n_slots = int(n_labels / _MAX_LOAD_FACTOR) + 1 if n_labels > 0 else 0
+    encoded_languages = languages_key.encode("utf-8")
+    table_start = _HEADER.size + len(encoded_languages)
+    blob_start = table_start + n_slots * _SLOT.size
+    with open(index_path, "wb") as out_stream:
+        out_stream.write(_HEADER.pack(_MAGIC, n_slots, n_labels, len(encoded_languages)))
+        out_stream.write(encoded_languages)
+        out_stream.truncate(blob_start)  # Zero-filled table: every slot starts empty
+        out_stream.seek(blob_start)
+        blob_stream.seek(0)
+        for a_chunk in iter(lambda: blob_stream.read(1 << 20), b""):
+            out_stream.write(a_chunk)
+    if n_slots == 0:
+        return
+    with open(index_path, "r+b") as out_stream:
+        with mmap.mmap(out_stream.fileno(), blob_start + blob_size) as mapped:
+            pairs_stream.seek(0)
+            for a_chunk in iter(lambda: pairs_stream.read(_PAIR.size * 4096), b""):
+                for key, blob_position in _PAIR.iter_unpack(a_chunk):
+                    slot = _slot_of(key, n_slots)
+                    while True:
+                        slot_key = _SLOT.unpack_from(mapped, table_start + slot * _SLOT.size)[0]
+                        if slot_key == 0 or slot_key == key:  # Duplicated ids in the dump: last one wins
+                            _SLOT.pack_into(mapped, table_start + slot * _SLOT.size, key, blob_position)
+                            break
+                        slot = (slot + 1) % n_slots
+            mapped.flush()
+
+
+def _slot_of(key, n_slots):
+    return ((key * _HASH_MULTIPLIER) & _UINT64_MASK) % n_slots
+
+
+def _encode_id(an_id):
+    # Q42 --> 85, P31 --> 64. 0 is kept free to mark empty slots
+    if len(an_id) < 2 or not an_id[1:].isdigit():
+        return None
+    if an_id[0] == "Q":
+        return (int(an_id[1:]) << 1) + 1
+    if an_id[0] == "P":
+        return (int(an_id[1:]) << 1) + 2
+    return None
+
+
+def _open_dump(dump_path):
+    if dump_path.endswith(".gz"):
+        return gzip.open(dump_path, "rt", encoding="utf-8")
+    if dump_path.endswith(".bz2"):
+        return bz2.open(dump_path, "rt", encoding="utf-8")
+    return open(dump_path, encoding="utf-8")
+
+
+def yield_dump_entities(dump_path):
+    """
+    It streams the entities of a wikidata JSON dump (.json, .json.gz or .json.bz2).
+
+    :param dump_path: disk path of the dump
+    :return: generator of (id, labels json) pairs
+    """
+    # Dumps are a JSON array with an entity per line: "[", "{...},", ..., "{...}", "]"
+    decoder = json.JSONDecoder()
+    with _open_dump(dump_path) as in_stream:
+        for a_line in in_stream:
+            a_line = a_line.strip()
+            if a_line.endswith(","):
+                a_line = a_line[:-1]
+            if len(a_line) == 0 or a_line in ("[", "]"):
+                continue
+            yield _parse_id_and_labels(a_line, decoder)
+
+
+def _parse_id_and_labels(a_line, decoder):
+    # Decoding just "id" and "labels" avoids building the (huge) claims of each entity. Dumps
+    # write "id" before "labels", so the first "id" found is the one of the entity. Otherwise,
+    # fall back to decode the whole entity
+    labels_position = a_line.find(_LABELS_KEY)
+    id_position = a_line.find(_ID_KEY)
+    if 0 <= id_position < labels_position:
+        an_id = decoder.raw_decode(a_line, _skip_spaces(a_line, id_position + len(_ID_KEY)))[0]
+        labels = decoder.raw_decode(a_line, _skip_spaces(a_line, labels_position + len(_LABELS_KEY)))[0]
+        return an_id, labels
+    entity = json.loads(a_line)
+    return entity.get("id", ""), entity.get("labels", {})
+
+
+def _skip_spaces(a_line, position):
+    while a_line[position] == " ":
+        position += 1
+    return position
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Build a wLighter label index from a wikidata JSON dump")
+    arg_parser.add_argument("dump", help="path of the dump (.json, .json.gz or .json.bz2)")
+    arg_parser.add_argument("index", help="path of the index to write")
+    arg_parser.add_argument("-l", "--languages", default="en",
+                            help="comma separated list of sorted preferred languages. Default: en")
+    args = arg_parser.parse_args()
+    print(build_label_index(dump_path=args.dump,
+                            index_path=args.index,
+                            languages=args.languages.split(",")))
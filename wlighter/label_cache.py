@@ -0,0 +1,114 @@
+import sqlite3
+import threading
+import time
+
+####### CONSTS
+
+DEFAULT_CACHE_TTL = 30 * 24 * 60 * 60  # Seconds. Labels rarely change, a month is fine
+DEFAULT_CACHE_MAX_ENTRIES = 1000000
+
+###### PRIVATE MEMBERS
+
+_IN_MEMORY = ":memory:"
+_MAX_PARAMS_PER_QUERY = 500  # SQLite builds may limit host parameters to 999
+
+_CREATE_TABLE = "CREATE TABLE IF NOT EXISTS labels (" \
+                "id TEXT NOT NULL, " \
+                "languages TEXT NOT NULL, " \
+                "label TEXT NOT NULL, " \
+                "stored_at REAL NOT NULL, " \
+                "accessed_at REAL NOT NULL, " \
+                "PRIMARY KEY (id, languages))"
+_CREATE_INDEX = "CREATE INDEX IF NOT EXISTS labels_accessed_at ON labels (accessed_at)"
+
+_SELECT_LABELS = "SELECT id, label, stored_at FROM labels WHERE languages = ? AND id IN ({})"
+_TOUCH_LABEL = "UPDATE labels SET accessed_at = ? WHERE id = ? AND languages = ?"
+_UPSERT_LABEL = "INSERT OR REPLACE INTO labels (id, languages, label, stored_at, accessed_at) VALUES (?, ?, ?, ?, ?)"
+_DELETE_EXPIRED = "DELETE FROM labels WHERE stored_at < ?"
+_COUNT_LABELS = "SELECT COUNT(*) FROM labels"
+_DELETE_LEAST_RECENTLY_USED = "DELETE FROM labels WHERE rowid IN " \
+                              "(SELECT rowid FROM labels ORDER BY accessed_at ASC LIMIT ?)"
+
+
+class LabelCache(object):
+
+    def __init__(self, path=None, ttl=DEFAULT_CACHE_TTL, max_entries=DEFAULT_CACHE_MAX_ENTRIES):
+        """
+
+        :param path: disk path of the SQLite file used to persist the labels. If None, the cache lives in memory
+                and it is lost when the object is garbage collected
+        :param ttl: seconds during which a stored label is considered valid. None means no expiration
+        :param max_entries: max number of (id, languages) entries kept. The least recently used ones are
+                evicted when this limit is exceeded. None means no limit
+        """
+        self._path = _IN_MEMORY if path is None else path
+        self._ttl = ttl
+        self._max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self._path, check_same_thread=False)
+        self._connection.execute(_CREATE_TABLE)
+        self._connection.execute(_CREATE_INDEX)
+        self._connection.commit()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get_labels(self, ids, languages_key):
+        """
+        It looks for the labels of the received ids. Expired entries are ignored.
+
+        :param ids: iterable of wikidata ids (QXX or PXX)
+        :param languages_key: str identifying the chain of languages used to choose the labels
+        :return: dict id --> label containing just the ids found in the cache
+        """
+        ids = list(ids)
+        result = {}
+        now = time.time()
+        with self._lock:
+            for i in range(0, len(ids), _MAX_PARAMS_PER_QUERY):
+                group = ids[i:i + _MAX_PARAMS_PER_QUERY]
+                query = _SELECT_LABELS.format(",".join("?" * len(group)))
+                for an_id, a_label, stored_at in self._connection.execute(query, [languages_key] + group):
+                    if not self._is_expired(stored_at, now):
+                        result[an_id] = a_label
+            if len(result) > 0:
+                self._connection.executemany(_TOUCH_LABEL,
+                                             [(now, an_id, languages_key) for an_id in result])
+                self._connection.commit()
+            self.hits += len(result)
+            self.misses += len(ids) - len(result)
+        return result
+
+    def put_labels(self, labels_dict, languages_key):
+        """
+        It stores (or refreshes) the received labels.
+
+        :param labels_dict: dict id --> label
+        :param languages_key: str identifying the chain of languages used to choose the labels
+        :return:
+        """
+        if len(labels_dict) == 0:
+            return
+        now = time.time()
+        with self._lock:
+            self._connection.executemany(_UPSERT_LABEL,
+                                         [(an_id, languages_key, a_label, now, now)
+                                          for an_id, a_label in labels_dict.items()])
+            self._evict(now)
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+    def _is_expired(self, stored_at, now):
+        return self._ttl is not None and now - stored_at > self._ttl
+
+    def _evict(self, now):
+        if self._ttl is not None:
+            self._connection.execute(_DELETE_EXPIRED, (now - self._ttl,))
+        if self._max_entries is not None:
+            exceeding = self._connection.execute(_COUNT_LABELS).fetchone()[0] - self._max_entries
+            if exceeding > 0:
+                self._connection.execute(_DELETE_LEAST_RECENTLY_USED, (exceeding,))
@@ -0,0 +1,37 @@
+####### CONSTS
+
+DEFAULT_LANGUAGE = "en"
+NO_LABEL = "(no label available)"
+
+
+def build_languages_for_api(languages):
+    """
+    It builds the chain of languages to ask wikidata for, in the API format ("es|fr|en").
+    English is always included, since it is the fallback language.
+
+    :param languages: list with sorted preferred languages
+    :return: str
+    """
+    if len(languages) == 0:
+        return DEFAULT_LANGUAGE
+    result = "|".join(languages)
+    if DEFAULT_LANGUAGE in languages:
+        return result
+    else:
+        return result + "|" + DEFAULT_LANGUAGE
+
+
+def choose_label(labels_entity_json, languages):
+    """
+    It picks the label of the first preferred language available, falling back to English.
+
+    :param labels_entity_json: "labels" object of a wikidata entity, i.e., {"en": {"language": "en", "value": ...}, ...}
+    :param languages: list with sorted preferred languages
+    :return: the label, or None if there is no label in any of those languages
+    """
+    for a_language in languages:
+        if a_language in labels_entity_json:
+            return labels_entity_json[a_language]["value"]
+    if DEFAULT_LANGUAGE in labels_entity_json:
+        return labels_entity_json[DEFAULT_LANGUAGE]["value"]
+    return None
@@ -0,0 +1,115 @@
+import hashlib
+import json
+import os
+
+####### CONSTS
+
+MANIFEST_EXTENSION = ".wlmanifest"
+
+###### PRIVATE MEMBERS
+
+_MANIFEST_VERSION = 2  # 1 did not know about ids left unsolved
+_READ_CHUNK = 1 << 20
+
+
+def manifest_path_of(out_file):
+    return out_file + MANIFEST_EXTENSION
+
+
+def digest_of_file(path):
+    result = hashlib.sha256()
+    with open(path, "rb") as in_stream:
+        for a_chunk in iter(lambda: in_stream.read(_READ_CHUNK), b""):
+            result.update(a_chunk)
+    return result.hexdigest()
+
+
+def digest_of_str(content):
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def digest_of_line(a_line):
+    return hashlib.sha1(a_line.encode("utf-8")).hexdigest()
+
+
+class AnnotationManifest(object):
+    """
+    Sidecar file stored next to an annotated output. It records the settings used to produce it,
+    digests of its input and output, and the labels written for each annotated line (indexed by a
+    digest of the line content). It allows to skip files that did not change, and to reuse the
+    labels of the lines that did not change without asking wikidata again. Lines mentioning ids that
+    could not be solved (the API was failing, for example) are not recorded, and an output containing
+    them is never up to date, so those ids are asked again in the next execution.
+    """
+
+    def __init__(self, settings, input_digest=None, output_digest=None, lines=None, complete=True):
+        self._settings = settings
+        self._input_digest = input_digest
+        self._output_digest = output_digest
+        self._lines = {} if lines is None else lines
+        self._complete = complete
+
+    @staticmethod
+    def load(out_file, settings):
+        """
+        It loads the manifest of out_file.
+
+        :param out_file: disk path of an annotated output
+        :param settings: dict with the current annotation settings
+        :return: the manifest, or None if there is no manifest or it was produced with other settings
+        """
+        path = manifest_path_of(out_file)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with open(path, encoding="utf-8") as in_stream:
+                content = json.load(in_stream)
+        except ValueError:
+            return None  # Broken manifest. It will be overwritten
+        if content.get("version") != _MANIFEST_VERSION or content.get("settings") != settings:
+            return None
+        return AnnotationManifest(settings=settings,
+                                  input_digest=content["input_digest"],
+                                  output_digest=content["output_digest"],
+                                  lines=content["lines"],
+                                  complete=content["complete"])
+
+    def is_up_to_date(self, input_digest, out_file):
+        """
+        The output is up to date if every id was solved, it was not modified since the manifest was written,
+        and the input is the same one used to produce it (or the output itself, when annotating in place).
+        """
+        if not self._complete or not os.path.isfile(out_file):
+            return False
+        if input_digest not in (self._input_digest, self._output_digest):
+            return False
+        return digest_of_file(out_file) == self._output_digest
+
+    def labels_of_line(self, line_digest):
+        """
+
+        :param line_digest: digest of the content of a line, without annotations
+        :return: dict id --> label written for that line, or None if unknown
+        """
+        return self._lines.get(line_digest)
+
+    def add_line(self, line_digest, labels):
+        self._lines[line_digest] = labels
+
+    def mark_incomplete(self):
+        """
+        Some ids of the output could not be solved.
+        """
+        self._complete = False
+
+    def save(self, out_file, input_digest):
+        self._input_digest = input_digest
+        self._output_digest = digest_of_file(out_file)
+        with open(manifest_path_of(out_file), "w", encoding="utf-8") as out_stream:
+            json.dump({"version": _MANIFEST_VERSION,
+                       "settings": self._settings,
+                       "input_digest": self._input_digest,
+                       "output_digest": self._output_digest,
+                       "complete": self._complete,
+                       "lines": self._lines},
+                      out_stream)
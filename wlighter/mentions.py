@@ -0,0 +1,91 @@
+from array import array
+from bisect import bisect_left
+
+
+class MentionIndex(object):
+    """
+    Compact storage of the ids mentioned in each line. Ids are interned into integer codes, and the
+    mentions of the annotated lines are kept CSR-style in three flat arrays:
+      - lines: number of each line having mentions, in increasing order
+      - offsets: mentions of lines[i] are codes[offsets[i]:offsets[i + 1]]
+      - codes: codes of the mentioned ids
+    So memory grows with the number of mentions (a few bytes each) instead of with the number of
+    Python objects (a set per line).
+    """
+
+    def __init__(self):
+        self._codes_by_id = {}
+        self._ids = []
+
+        self._lines = array("I")
+        self._offsets = array("Q", [0])
+        self._codes = array("I")
+
+    @property
+    def ids(self):
+        """
+        List of distinct ids mentioned, in order of first appearance. The position of each id is its code.
+        """
+        return self._ids
+
+    @property
+    def n_mentions(self):
+        return len(self._codes)
+
+    def __len__(self):
+        return len(self._lines)
+
+    def add_line(self, line_number, mentions):
+        """
+
+        :param line_number: int. It must be greater than any line added before
+        :param mentions: non empty iterable of distinct ids mentioned in the line
+        :return:
+        """
+        for an_id in mentions:
+            self._codes.append(self._intern(an_id))
+        self._lines.append(line_number)
+        self._offsets.append(len(self._codes))
+
+    def extend(self, other, line_offset):
+        """
+        It appends the lines of another index, shifting their numbers.
+
+        :param other: MentionIndex. Its lines, once shifted, must be greater than any line added before
+        :param line_offset: int added to the line numbers of other
+        :return:
+        """
+        codes_in_self = [self._intern(an_id) for an_id in other._ids]
+        offset_shift = len(self._codes)
+        self._codes.extend(codes_in_self[a_code] for a_code in other._codes)
+        self._lines.extend(a_line + line_offset for a_line in other._lines)
+        self._offsets.extend(an_offset + offset_shift for an_offset in other._offsets[1:])
+
+    def mentions_of(self, line_number):
+        """
+
+        :param line_number: int
+        :return: list of ids mentioned in that line (empty if none)
+        """
+        position = bisect_left(self._lines, line_number)
+        if position == len(self._lines) or self._lines[position] != line_number:
+            return []
+        return self._ids_of_position(position)
+
+    def yield_line_mentions(self):
+        """
+        It yields (line number, list of ids mentioned) for every line having mentions, in line order.
+        """
+        for position in range(len(self._lines)):
+            yield self._lines[position], self._ids_of_position(position)
+
+    def _ids_of_position(self, position):
+        return [self._ids[a_code] for a_code in self._codes[self._offsets[position]:self._offsets[position + 1]]]
+
+    def _intern(self, an_id):
+        code = self._codes_by_id.get(an_id)
+        if code is None:
+            code = len(self._ids)
+            self._codes_by_id[an_id] = code
+            self._ids.append(an_id)
+        return code
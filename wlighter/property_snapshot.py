@@ -0,0 +1,245 @@
+import argparse
+import datetime
+import json
+import mmap
+import os
+import struct
+import zlib
+from collections import OrderedDict
+
+from wlighter.labels import DEFAULT_LANGUAGE, build_languages_for_api
+from wlighter.dump_index import yield_dump_entities
+from wlighter.wikidata_api import WikidataApiClient
+
+####### CONSTS
+
+SNAPSHOT_EXTENSION = ".wlprops"
+
+###### PRIVATE MEMBERS
+
+# Snapshot layout (little endian):
+#   header:   magic (8 bytes) | n_slots (uint32) | n_languages (uint32) | n_labels (uint32)
+#             | metadata length (uint32) | metadata (utf-8 JSON: version, languages, source)
+#   tables:   per language, n_slots x uint32. Slot N belongs to PN and holds 1 + the number of its
+#             label, or 0 if it has no label in that language
+#   blocks:   (n_blocks + 1) x uint64 offsets of the compressed blocks, relative to the first one,
+#             followed by the blocks. Block B holds, zlib compressed, the labels numbered from
+#             B * _LABELS_PER_BLOCK on, each one as [length (uint16) | utf-8 bytes]. Labels repeated
+#             among properties or languages are stored just once
+# So the tables are read in place from the mapped file, and a lookup just decompresses the block of its label.
+_MAGIC = b"WLPSN002"
+_HEADER = struct.Struct("<8sIIII")
+_SLOT = struct.Struct("<I")
+_BLOCK_OFFSET = struct.Struct("<Q")
+_LABEL_LENGTH = struct.Struct("<H")
+_LABELS_PER_BLOCK = 64
+_CACHED_BLOCKS = 16
+
+
+def build_property_snapshot(snapshot_path, languages=None, dump_path=None, api_url=None):
+    """
+    It writes a snapshot with the labels of every wikidata property in several languages, so properties
+    can be annotated without calling the wikidata API (see the property_snapshot param of WLighter).
+    Labels are taken from a wikidata JSON dump, if provided, or from the wikidata API otherwise.
+    Run it again to refresh the snapshot.
+
+    :param snapshot_path: disk path where the snapshot will be written
+    :param languages: list of languages to include. English is always included. ["en"] if None
+    :param dump_path: disk path of a wikidata JSON dump (.json, .json.gz or .json.bz2)
+    :param api_url: URL of the wikidata API (api.php). The public wikidata endpoint is used if None
+    :return: number of properties with some label in the snapshot
+    """
+    languages = build_languages_for_api([] if languages is None else languages).split("|")
+    if dump_path is not None:
+        labels_json = ((an_id, a_json) for an_id, a_json in yield_dump_entities(dump_path)
+                       if _number_of(an_id) is not None)
+        source = os.path.basename(dump_path)
+    else:
+        api_client = WikidataApiClient(api_url=api_url)
+        try:
+            labels_json = api_client.get_labels_json(ids=api_client.get_property_ids(),
+                                                     languages_for_api="|".join(languages))
+        finally:
+            api_client.close()
+        source = "wikidata API"
+    labels_by_language = {a_language: {} for a_language in languages}
+    for an_id, a_json in labels_json:
+        for a_language in languages:
+            if a_language in a_json:
+                labels_by_language[a_language][_number_of(an_id)] = a_json[a_language]["value"]
+    return _write_snapshot(snapshot_path=snapshot_path,
+                           languages=languages,
+                           labels_by_language=labels_by_language,
+                           metadata={"version": datetime.datetime.now(datetime.timezone.utc).strftime("%Y-%m-%d"),
+                                     "languages": languages,
+                                     "source": source})
+
+
+class PropertySnapshot(object):
+    """
+    Read-only access to a snapshot built with build_property_snapshot. The file is memory-mapped: each
+    lookup reads a fixed position of it, and decompresses the block holding the label. The last blocks
+    decompressed are kept.
+    """
+
+    def __init__(self, snapshot_path):
+        self._snapshot_path = snapshot_path
+        self._stream = open(snapshot_path, "rb")
+        self._mapped = mmap.mmap(self._stream.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self._n_slots, n_languages, n_labels, metadata_length = _HEADER.unpack_from(self._mapped, 0)
+        if magic != _MAGIC:
+            self.close()
+            raise ValueError("The file is not a wLighter property snapshot, or it was built by an older "
+                             "version (build it again): " + snapshot_path)
+        self._metadata = json.loads(self._mapped[_HEADER.size:_HEADER.size + metadata_length].decode("utf-8"))
+        tables_start = _HEADER.size + metadata_length
+        self._table_starts = {a_language: tables_start + i * self._n_slots * _SLOT.size
+                              for i, a_language in enumerate(self._metadata["languages"])}
+        self._block_offsets_start = tables_start + n_languages * self._n_slots * _SLOT.size
+        n_blocks = -(-n_labels // _LABELS_PER_BLOCK)
+        self._blocks_start = self._block_offsets_start + (n_blocks + 1) * _BLOCK_OFFSET.size
+        self._blocks = OrderedDict()  # block number --> list of its labels
+
+    @property
+    def version(self):
+        """
+        Date (YYYY-MM-DD) in which the labels were obtained
+        """
+        return self._metadata["version"]
+
+    @property
+    def languages(self):
+        return list(self._metadata["languages"])
+
+    def covers(self, languages):
+        """
+        :param languages: list with sorted preferred languages
+        :return: True if the snapshot includes every one of them (and English, used as fallback)
+        """
+        return all(a_language in self._table_starts for a_language in build_languages_for_api(languages).split("|"))
+
+    def get_label(self, an_id, languages):
+        """
+        It picks the label of the first preferred language available, falling back to English. Languages
+        not included in the snapshot are skipped: check covers() first.
+
+        :param an_id: wikidata id. Just properties (PXX) can be found
+        :param languages: list with sorted preferred languages
+        :return: the label, or None if the property has no label in those languages
+        """
+        number = _number_of(an_id)
+        if number is None or number >= self._n_slots:
+            return None
+        for a_language in languages + [DEFAULT_LANGUAGE]:
+            if a_language not in self._table_starts:
+                continue
+            label_number = _SLOT.unpack_from(self._mapped, self._table_starts[a_language] + number * _SLOT.size)[0]
+            if label_number != 0:
+                block_number, position = divmod(label_number - 1, _LABELS_PER_BLOCK)
+                return self._block(block_number)[position]
+        return None
+
+    def get_labels(self, ids, languages):
+        """
+
+        :param ids: iterable of wikidata ids
+        :param languages: list with sorted preferred languages
+        :return: dict id --> label containing just the properties found in the snapshot
+        """
+        result = {}
+        for an_id in ids:
+            label = self.get_label(an_id, languages)
+            if label is not None:
+                result[an_id] = label
+        return result
+
+    def close(self):
+        self._mapped.close()
+        self._stream.close()
+
+    def _block(self, block_number):
+        if block_number in self._blocks:
+            self._blocks.move_to_end(block_number)
+            return self._blocks[block_number]
+        offsets_start = self._block_offsets_start + block_number * _BLOCK_OFFSET.size
+        block_start = self._blocks_start + _BLOCK_OFFSET.unpack_from(self._mapped, offsets_start)[0]
+        block_end = self._blocks_start + _BLOCK_OFFSET.unpack_from(self._mapped, offsets_start + _BLOCK_OFFSET.size)[0]
+        block = _labels_of_block(zlib.decompress(self._mapped[block_start:block_end]))
+        self._blocks[block_number] = block
+        if len(self._blocks) > _CACHED_BLOCKS:
+            self._blocks.popitem(last=False)
+        return block
+
+
+def _write_snapshot(snapshot_path, languages, labels_by_language, metadata):
+    n_slots = 1 + max((max(labels, default=0) for labels in labels_by_language.values()), default=0)
+    label_numbers = {}
+    tables = []
+    for a_language in languages:
+        a_table = bytearray(n_slots * _SLOT.size)
+        for number, a_label in labels_by_language[a_language].items():
+            if a_label not in label_numbers:
+                label_numbers[a_label] = len(label_numbers)
+            _SLOT.pack_into(a_table, number * _SLOT.size, label_numbers[a_label] + 1)
+        tables.append(a_table)
+    labels = list(label_numbers)  # Sorted by number
+    blocks = [zlib.compress(_block_of_labels(labels[i:i + _LABELS_PER_BLOCK]))
+              for i in range(0, len(labels), _LABELS_PER_BLOCK)]
+    encoded_metadata = json.dumps(metadata).encode("utf-8")
+    with open(snapshot_path, "wb") as out_stream:
+        out_stream.write(_HEADER.pack(_MAGIC, n_slots, len(languages), len(labels), len(encoded_metadata)))
+        out_stream.write(encoded_metadata)
+        for a_table in tables:
+            out_stream.write(a_table)
+        block_offset = 0
+        out_stream.write(_BLOCK_OFFSET.pack(block_offset))
+        for a_block in blocks:
+            block_offset += len(a_block)
+            out_stream.write(_BLOCK_OFFSET.pack(block_offset))
+        for a_block in blocks:
+            out_stream.write(a_block)
+    return len({number for labels in labels_by_language.values() for number in labels})
+
+
+def _block_of_labels(labels):
+    block = bytearray()
+    for a_label in labels:
+        encoded_label = a_label.encode("utf-8")
+        block += _LABEL_LENGTH.pack(len(encoded_label)) + encoded_label
+    return bytes(block)
+
+
+def _labels_of_block(block):
+    labels = []
+    label_start = 0
+    while label_start < len(block):
+        label_length = _LABEL_LENGTH.unpack_from(block, label_start)[0]
+        label_start += _LABEL_LENGTH.size
+        labels.append(block[label_start:label_start + label_length].decode("utf-8"))
+        label_start += label_length
+    return labels
+
+
+def _number_of(an_id):
+    # P31 --> 31. None for anything but properties
+    if len(an_id) < 2 or an_id[0] != "P" or not an_id[1:].isdigit():
+        return None
+    return int(an_id[1:])
+
+
+if __name__ == "__main__":
+    arg_parser = argparse.ArgumentParser(description="Build or refresh a wLighter property label snapshot")
+    arg_parser.add_argument("snapshot", help="path of the snapshot to write (" + SNAPSHOT_EXTENSION + ")")
+    arg_parser.add_argument("-l", "--languages", default="en",
+                            help="comma separated list of languages to include. English is always included. "
+                                 "Default: en")
+    arg_parser.add_argument("-d", "--dump", default=None,
+                            help="path of a wikidata JSON dump (.json, .json.gz or .json.bz2) to take the labels "
+                                 "from. If not provided, they are asked to the wikidata API")
+    arg_parser.add_argument("--api-url", default=None,
+                            help="URL of the wikidata API (api.php). Default: the public wikidata endpoint")
+    args = arg_parser.parse_args()
+    print(build_property_snapshot(snapshot_path=args.snapshot,
+                                  languages=args.languages.split(","),
+                                  dump_path=args.dump,
+                                  api_url=args.api_url))
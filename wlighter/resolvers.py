@@ -0,0 +1,473 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+from wlighter.labels import NO_LABEL, build_languages_for_api, choose_label
+
+####### CONSTS
+
+DEFAULT_MEMORY_ENTRIES = 100000
+
+
+class LabelResolver(object):
+    """
+    A tier of a ResolverChain. It receives a batch of ids and answers the ones it can. Subclasses implement
+    get_labels, and put_labels if they can keep the labels found by the slower tiers of the chain.
+    """
+
+    name = "resolver"  # Used to report the figures of the tier
+
+    def get_labels(self, ids, languages, stats):
+        """
+
+        :param ids: list of wikidata ids
+        :param languages: list with sorted preferred languages
+        :param stats: AnnotationStats in which the work done is recorded
+        :return: dict id --> label containing just the ids solved. Ids known to have no label in those
+                languages can be solved as NO_LABEL
+        """
+        raise NotImplementedError()
+
+    def get_labels_in_languages(self, ids_by_chain, languages_chains, stats):
+        """
+        Same as get_labels, for several chains of languages at a time.
+
+        :param ids_by_chain: list with the ids to solve for each chain
+        :param languages_chains: list of lists of sorted preferred languages
+        :param stats: AnnotationStats in which the work done is recorded
+        :return: list with a dict id --> label per chain
+        """
+        return [self.get_labels(ids=ids, languages=languages, stats=stats) if len(ids) > 0 else {}
+                for ids, languages in zip(ids_by_chain, languages_chains)]
+
+    async def get_labels_async(self, ids, languages, stats, async_api_client):
+        """
+        Same as get_labels, but it does not block the event loop. By default, get_labels runs in a
+        worker thread.
+
+        :param async_api_client: AsyncWikidataApiClient that tiers asking wikidata should use
+        """
+        return await _run_in_thread(self.get_labels,
+                                    ids=ids,
+                                    languages=languages,
+                                    stats=stats)
+
+    def put_labels(self, labels, languages):
+        """
+        It keeps labels solved by slower tiers. Tiers that can not store labels ignore them.
+
+        :param labels: dict id --> label
+        :param languages: list with the sorted preferred languages used to choose those labels
+        :return:
+        """
+        pass
+
+    def is_final(self, languages):
+        """
+        :return: True if the ids this tier can not solve in those languages have no label at all, so the
+                slower tiers are not asked for them
+        """
+        return False
+
+
+class MemoryResolver(LabelResolver):
+    """
+    Thread-safe in-memory LRU of labels. Put it first in a chain shared by many annotations.
+    """
+
+    name = "memory"
+
+    def __init__(self, max_entries=DEFAULT_MEMORY_ENTRIES):
+        """
+
+        :param max_entries: max number of labels kept. The least recently used ones are discarded first
+        """
+        if max_entries < 1:
+            raise ValueError("max_entries must be a positive integer")
+        self._max_entries = max_entries
+        self._lock = threading.Lock()
+        self._labels = OrderedDict()  # (languages key, id) --> label
+
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._labels)
+
+    def get_labels(self, ids, languages, stats):
+        languages_key = build_languages_for_api(languages)
+        result = {}
+        with self._lock:
+            for an_id in ids:
+                a_key = (languages_key, an_id)
+                if a_key in self._labels:
+                    self._labels.move_to_end(a_key)
+                    result[an_id] = self._labels[a_key]
+            self.hits += len(result)
+            self.misses += len(ids) - len(result)
+        stats.labels_reused += len(result)
+        return result
+
+    def put_labels(self, labels, languages):
+        languages_key = build_languages_for_api(languages)
+        with self._lock:
+            for an_id, a_label in labels.items():
+                self._labels[(languages_key, an_id)] = a_label
+                self._labels.move_to_end((languages_key, an_id))
+            while len(self._labels) > self._max_entries:
+                self._labels.popitem(last=False)
+
+
+class CacheResolver(LabelResolver):
+    """
+    Tier backed by a LabelCache (in memory or in a SQLite file).
+    """
+
+    name = "cache"
+
+    def __init__(self, label_cache):
+        self._label_cache = label_cache
+
+    @property
+    def label_cache(self):
+        return self._label_cache
+
+    def get_labels(self, ids, languages, stats):
+        result = self._label_cache.get_labels(ids=ids,
+                                              languages_key=build_languages_for_api(languages))
+        stats.cache_hits += len(result)
+        stats.cache_misses += len(ids) - len(result)
+        return result
+
+    def put_labels(self, labels, languages):
+        self._label_cache.put_labels(labels_dict=labels,
+                                     languages_key=build_languages_for_api(languages))
+
+
+class PropertySnapshotResolver(LabelResolver):
+    """
+    Tier backed by a PropertySnapshot. It solves just properties, and just for the chains of languages
+    included in the snapshot. The rest go to the next tiers.
+    """
+
+    name = "snapshot"
+
+    def __init__(self, property_snapshot):
+        self._property_snapshot = property_snapshot
+
+    def get_labels(self, ids, languages, stats):
+        if not self._property_snapshot.covers(languages):
+            return {}
+        result = self._property_snapshot.get_labels(ids=ids,
+                                                    languages=languages)
+        stats.snapshot_hits += len(result)
+        return result
+
+
+class LabelIndexResolver(LabelResolver):
+    """
+    Tier backed by a LabelIndex built from a wikidata dump. The index has every entity of the dump, so for
+    the languages it was built for, ids missing in it have no label and the slower tiers are not asked.
+    """
+
+    name = "index"
+
+    def __init__(self, label_index):
+        self._label_index = label_index
+
+    def get_labels(self, ids, languages, stats):
+        if not self.is_final(languages):
+            return {}
+        result = self._label_index.get_labels(ids)
+        stats.index_hits += len(result)
+        return result
+
+    def is_final(self, languages):
+        return self._label_index.languages_key == build_languages_for_api(languages)
+
+
+class WikidataApiResolver(LabelResolver):
+    """
+    Tier asking the wikidata API. Ids whose requests keep failing are not solved.
+    """
+
+    name = "api"
+
+    def __init__(self, api_client):
+        """
+
+        :param api_client: WikidataApiClient
+        """
+        self._api_client = api_client
+
+    def get_labels(self, ids, languages, stats):
+        return self._labels_of(labels_json=self._api_client.get_labels_json(
+                                   ids=ids,
+                                   languages_for_api=build_languages_for_api(languages),
+                                   on_batch=stats.record_batch,
+                                   on_failed_batch=stats.record_failed_batch),
+                               languages=languages)
+
+    def get_labels_in_languages(self, ids_by_chain, languages_chains, stats):
+        # The labels of every chain are asked in the same requests, and then each chain picks its own
+        all_ids = {}  # Dicts keep the order, and find repetitions fast
+        all_languages = {}
+        for ids, languages in zip(ids_by_chain, languages_chains):
+            if len(ids) > 0:
+                all_ids.update((an_id, None) for an_id in ids)
+                all_languages.update((a_language, None)
+                                     for a_language in build_languages_for_api(languages).split("|"))
+        if len(all_ids) == 0:
+            return [{} for _ in languages_chains]
+        labels_json = self._api_client.get_labels_json(ids=list(all_ids),
+                                                       languages_for_api="|".join(all_languages),
+                                                       on_batch=stats.record_batch,
+                                                       on_failed_batch=stats.record_failed_batch)
+        result = []
+        for ids, languages in zip(ids_by_chain, languages_chains):
+            ids = set(ids)
+            result.append(self._labels_of(labels_json=[(an_id, a_json) for an_id, a_json in labels_json
+                                                       if an_id in ids],
+                                          languages=languages))
+        return result
+
+    async def get_labels_async(self, ids, languages, stats, async_api_client):
+        if async_api_client is None:
+            return await super().get_labels_async(ids=ids,
+                                                  languages=languages,
+                                                  stats=stats,
+                                                  async_api_client=async_api_client)
+        return self._labels_of(labels_json=await async_api_client.get_labels_json(
+                                   ids=ids,
+                                   languages_for_api=build_languages_for_api(languages),
+                                   on_batch=stats.record_batch,
+                                   on_failed_batch=stats.record_failed_batch),
+                               languages=languages)
+
+    def _labels_of(self, labels_json, languages):
+        result = {}
+        for an_id, labels_entity_json in labels_json:
+            a_label = choose_label(labels_entity_json=labels_entity_json,
+                                   languages=languages)
+            result[an_id] = NO_LABEL if a_label is None else a_label
+        return result
+
+
+class ResolverChain(object):
+    """
+    Ordered list of tiers solving labels, fastest first. Each tier gets the ids the previous ones could
+    not solve, and the labels it finds are written back into the tiers before it. The time spent and the
+    ids solved by each tier are recorded in the AnnotationStats of each annotation and in the chain itself,
+    so the order of the tiers can be tuned for each workload.
+    """
+
+    def __init__(self, tiers, single_flight=False):
+        """
+
+        :param tiers: list of LabelResolver, fastest first
+        :param single_flight: set to True when the chain is shared by annotations running in several threads
+                at a time. An id being solved by one of them is not asked again by the rest: they wait for
+                its result
+        """
+        self._tiers = list(tiers)
+        self._single_flight = single_flight
+
+        self._lock = threading.Lock()
+        self._in_flight = {}  # (languages key, id) --> _InFlight of the call solving it
+        self._figures = [_TierFigures() for _ in self._tiers]
+
+        self.shared_waits = 0
+
+    @property
+    def tiers(self):
+        return list(self._tiers)
+
+    def tier_stats(self):
+        """
+        Figures of each tier since the chain was built, in the order of the tiers.
+
+        :return: list of dicts with keys tier (name), calls, requested (ids received), hits (ids solved),
+                hit_rate and seconds (total time spent)
+        """
+        with self._lock:
+            return [{"tier": a_tier.name,
+                     "calls": figures.calls,
+                     "requested": figures.requested,
+                     "hits": figures.hits,
+                     "hit_rate": figures.hits / figures.requested if figures.requested > 0 else 0.0,
+                     "seconds": figures.seconds}
+                    for a_tier, figures in zip(self._tiers, self._figures)]
+
+    def get_labels(self, ids, languages, stats):
+        """
+        Thread-safe.
+
+        :param ids: list of wikidata ids
+        :param languages: list with sorted preferred languages
+        :param stats: AnnotationStats in which the work done is recorded
+        :return: dict id --> label. Ids that could not be solved are not included
+        """
+        if not self._single_flight:
+            return self._solve(ids=ids,
+                               languages=languages,
+                               stats=stats)
+        languages_key = build_languages_for_api(languages)
+        to_solve = []
+        to_wait = []
+        with self._lock:
+            for an_id in ids:
+                if (languages_key, an_id) in self._in_flight:
+                    to_wait.append((an_id, self._in_flight[(languages_key, an_id)]))
+                else:
+                    to_solve.append(an_id)
+            self.shared_waits += len(to_wait)
+            flight = _InFlight()
+            for an_id in to_solve:
+                self._in_flight[(languages_key, an_id)] = flight
+
+        result = {}
+        if len(to_solve) > 0:
+            try:
+                flight.labels = self._solve(ids=to_solve,
+                                            languages=languages,
+                                            stats=stats)
+            finally:  # On errors, waiting calls get no labels instead of waiting forever
+                with self._lock:
+                    for an_id in to_solve:
+                        del self._in_flight[(languages_key, an_id)]
+                flight.done.set()
+            result.update(flight.labels)
+
+        for an_id, a_flight in to_wait:
+            a_flight.done.wait()
+            if an_id in a_flight.labels:
+                result[an_id] = a_flight.labels[an_id]
+        return result
+
+    def get_labels_in_languages(self, ids, languages_chains, stats):
+        """
+        Same as get_labels, for several chains of languages at a time. Tiers may solve every chain in the
+        same work (the wikidata API tier asks for all the languages in the same requests).
+
+        :param ids: list of wikidata ids
+        :param languages_chains: list of lists of sorted preferred languages
+        :param stats: AnnotationStats in which the work done is recorded
+        :return: list with a dict id --> label per chain
+        """
+        result = [{} for _ in languages_chains]
+        pending_by_chain = [list(ids) for _ in languages_chains]
+        for position, a_tier in enumerate(self._tiers):
+            n_pending = sum(len(pending) for pending in pending_by_chain)
+            if n_pending == 0:
+                break
+            start = time.perf_counter()
+            found_by_chain = a_tier.get_labels_in_languages(ids_by_chain=pending_by_chain,
+                                                            languages_chains=languages_chains,
+                                                            stats=stats)
+            self._record(position=position,
+                         stats=stats,
+                         n_requested=n_pending,
+                         n_hits=sum(len(found) for found in found_by_chain),
+                         seconds=time.perf_counter() - start)
+            for i, (found, languages) in enumerate(zip(found_by_chain, languages_chains)):
+                self._write_back(position=position,
+                                 labels=found,
+                                 languages=languages)
+                result[i].update(found)
+                pending_by_chain[i] = [] if a_tier.is_final(languages) \
+                    else [an_id for an_id in pending_by_chain[i] if an_id not in found]
+        return result
+
+    async def get_labels_async(self, ids, languages, stats, async_api_client):
+        """
+        Same as get_labels, but it does not block the event loop. Calls are not single-flighted.
+
+        :param async_api_client: AsyncWikidataApiClient used by the tiers asking wikidata
+        """
+        result = {}
+        pending = list(ids)
+        for position, a_tier in enumerate(self._tiers):
+            if len(pending) == 0:
+                break
+            start = time.perf_counter()
+            found = await a_tier.get_labels_async(ids=pending,
+                                                  languages=languages,
+                                                  stats=stats,
+                                                  async_api_client=async_api_client)
+            self._record(position=position,
+                         stats=stats,
+                         n_requested=len(pending),
+                         n_hits=len(found),
+                         seconds=time.perf_counter() - start)
+            await _run_in_thread(self._write_back,
+                                 position=position,
+                                 labels=found,
+                                 languages=languages)
+            result.update(found)
+            pending = [] if a_tier.is_final(languages) else [an_id for an_id in pending if an_id not in found]
+        return result
+
+    def _solve(self, ids, languages, stats):
+        result = {}
+        pending = list(ids)
+        for position, a_tier in enumerate(self._tiers):
+            if len(pending) == 0:
+                break
+            start = time.perf_counter()
+            found = a_tier.get_labels(ids=pending,
+                                      languages=languages,
+                                      stats=stats)
+            self._record(position=position,
+                         stats=stats,
+                         n_requested=len(pending),
+                         n_hits=len(found),
+                         seconds=time.perf_counter() - start)
+            self._write_back(position=position,
+                             labels=found,
+                             languages=languages)
+            result.update(found)
+            pending = [] if a_tier.is_final(languages) else [an_id for an_id in pending if an_id not in found]
+        return result
+
+    def _write_back(self, position, labels, languages):
+        if len(labels) == 0:
+            return
+        for a_faster_tier in self._tiers[:position]:
+            a_faster_tier.put_labels(labels=labels,
+                                     languages=languages)
+
+    def _record(self, position, stats, n_requested, n_hits, seconds):
+        with self._lock:
+            figures = self._figures[position]
+            figures.calls += 1
+            figures.requested += n_requested
+            figures.hits += n_hits
+            figures.seconds += seconds
+        stats.record_tier(name=self._tiers[position].name,
+                          n_ids=n_requested,
+                          n_hits=n_hits,
+                          seconds=seconds)
+
+
+###### PRIVATE MEMBERS
+
+class _TierFigures(object):
+
+    def __init__(self):
+        self.calls = 0
+        self.requested = 0
+        self.hits = 0
+        self.seconds = 0.0
+
+
+class _InFlight(object):
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.labels = {}
+
+
+async def _run_in_thread(func, **kwargs):
+    import asyncio  # Just the async API needs it
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, **kwargs))
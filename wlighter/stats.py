@@ -0,0 +1,116 @@
+import threading
+import time
+from contextlib import contextmanager
+
+####### CONSTS
+
+PHASE_SCAN = "scan"  # Namespaces and mentions are collected in the same pass over the input
+PHASE_RESOLVE = "resolve"
+PHASE_OUTPUT = "output"
+
+EVENT_PHASE = "phase"
+EVENT_BATCH = "batch"
+EVENT_FAILED_BATCH = "failed_batch"
+EVENT_TIER = "tier"
+
+
+class AnnotationStats(object):
+    """
+    Figures about the last annotation performed by a WLighter object. If a hook is provided, it is called
+    as hook(event, data) at the end of each phase (event EVENT_PHASE, data {"phase": ..., "seconds": ...})
+    and after each request to the wikidata API (event EVENT_BATCH, data {"ids": ..., "seconds": ...,
+    "bytes": ...}). Failed requests are reported as EVENT_FAILED_BATCH, data {"ids": ..., "seconds": ...,
+    "reason": ...}. Each tier of the resolver chain reports its work as EVENT_TIER, data {"tier": ..., "ids": ...,
+    "hits": ..., "seconds": ...}. Batches and tiers may be reported from several threads at a time.
+    Ids that no tier could solve (their requests kept failing, or the API seemed down and they were given up)
+    are annotated as having no label, and listed in unsolved_ids. In streaming mode, distinct_ids is
+    approximate: it counts the ids of each window that were not in the label cache yet, so ids cached by
+    previous executions, or evicted and found again, are miscounted.
+    """
+
+    def __init__(self, hook=None):
+        self._hook = hook
+        self._lock = threading.Lock()
+
+        self.phase_seconds = {}
+        self.lines_scanned = 0
+        self.mentions_found = 0
+        self.distinct_ids = 0
+        self.batches_sent = 0
+        self.failed_batches = 0
+        self.bytes_received = 0
+        self.batch_latencies = []
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.index_hits = 0
+        self.snapshot_hits = 0
+        self.labels_reused = 0
+        self.tiers = {}  # tier name --> {"requested": ..., "hits": ..., "seconds": ...}
+        self.unsolved_ids = []
+        self.skipped = False
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            seconds = time.perf_counter() - start
+            with self._lock:
+                self.phase_seconds[name] = self.phase_seconds.get(name, 0.0) + seconds
+            self._notify(EVENT_PHASE, {"phase": name,
+                                       "seconds": seconds})
+
+    def record_batch(self, n_ids, seconds, n_bytes):
+        with self._lock:
+            self.batches_sent += 1
+            self.bytes_received += n_bytes
+            self.batch_latencies.append(seconds)
+        self._notify(EVENT_BATCH, {"ids": n_ids,
+                                   "seconds": seconds,
+                                   "bytes": n_bytes})
+
+    def record_failed_batch(self, n_ids, seconds, reason):
+        with self._lock:
+            self.failed_batches += 1
+        self._notify(EVENT_FAILED_BATCH, {"ids": n_ids,
+                                          "seconds": seconds,
+                                          "reason": reason})
+
+    def record_tier(self, name, n_ids, n_hits, seconds):
+        with self._lock:
+            figures = self.tiers.setdefault(name, {"requested": 0, "hits": 0, "seconds": 0.0})
+            figures["requested"] += n_ids
+            figures["hits"] += n_hits
+            figures["seconds"] += seconds
+        self._notify(EVENT_TIER, {"tier": name,
+                                  "ids": n_ids,
+                                  "hits": n_hits,
+                                  "seconds": seconds})
+
+    def record_unsolved(self, ids):
+        with self._lock:
+            self.unsolved_ids.extend(ids)
+
+    def as_dict(self):
+        with self._lock:
+            return {"phase_seconds": dict(self.phase_seconds),
+                    "lines_scanned": self.lines_scanned,
+                    "mentions_found": self.mentions_found,
+                    "distinct_ids": self.distinct_ids,
+                    "batches_sent": self.batches_sent,
+                    "failed_batches": self.failed_batches,
+                    "bytes_received": self.bytes_received,
+                    "batch_latencies": list(self.batch_latencies),
+                    "cache_hits": self.cache_hits,
+                    "cache_misses": self.cache_misses,
+                    "index_hits": self.index_hits,
+                    "snapshot_hits": self.snapshot_hits,
+                    "labels_reused": self.labels_reused,
+                    "tiers": {a_name: dict(figures) for a_name, figures in self.tiers.items()},
+                    "unsolved_ids": list(self.unsolved_ids),
+                    "skipped": self.skipped}
+
+    def _notify(self, event, data):
+        if self._hook is not None:
+            self._hook(event, data)
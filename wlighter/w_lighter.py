@@ -1,10 +1,30 @@
+import functools
+import io
+import mmap
+import os
 import re
-import requests
+import tempfile
+from wlighter.wikidata_api import WikidataApiClient, AsyncWikidataApiClient, DEFAULT_MAX_CONCURRENT_CALLS, \
+    DEFAULT_MAX_RETRIES, DEFAULT_MAXLAG
+from wlighter.labels import build_languages_for_api, NO_LABEL
+from wlighter.label_cache import LabelCache, DEFAULT_CACHE_TTL, DEFAULT_CACHE_MAX_ENTRIES
+from wlighter.dump_index import LabelIndex
+from wlighter.property_snapshot import PropertySnapshot
+from wlighter.stats import AnnotationStats, PHASE_SCAN, PHASE_RESOLVE, PHASE_OUTPUT
+from wlighter.mentions import MentionIndex
+from wlighter.resolvers import ResolverChain, CacheResolver, PropertySnapshotResolver, LabelIndexResolver, \
+    WikidataApiResolver
+from wlighter.manifest import AnnotationManifest, digest_of_file, digest_of_str, digest_of_line
 
 ####### CONSTS
 
 SHEXC_FORMAT = "shexc"
 TURTLE_FORMAT = "turtle"
+NTRIPLES_FORMAT = "ntriples"
+
+ANNOTATE_ENTITIES = "entities"
+ANNOTATE_PROPERTIES = "properties"
+ANNOTATE_ALL = "all"
 
 ###### PRIVATE MEMBERS
 
@@ -18,32 +38,135 @@ _ENTITY = "http://www.wikidata.org/entity/"
 ##### PARSERS
 
 class AbstractParser(object):
-    def __init__(self, raw_input, file_input):
+    """
+    The content is read just once through yield_lines(). Later on, replay_lines() produces the same
+    lines again without re-reading the input: raw input is kept already split, file input is
+    replayed from a read-only memory map of the source file, and the lines read from stream input
+    are kept as they are read. stream_lines() reads stream input without keeping its lines.
+    """
+
+    _PREFIX_NEEDLE = None  # Bytes that any line declaring a prefix contains. None if the format has no prefixes
+
+    def __init__(self, raw_input, file_input, stream_input=None):
         self._raw_input = raw_input
         self._file_input = file_input
+        self._stream_input = stream_input
+
+        self._raw_lines = None
 
     def yield_prefix_namespace_pairs(self):
         for a_line in self.yield_lines():
+            for a_pair in self.yield_prefix_namespace_pairs_in_line(a_line):
+                yield a_pair
+
+    def yield_prefix_namespace_pairs_in_line(self, a_line):
+        if self._may_declare_prefix(a_line):
             for a_pair in self._yield_prefix_namespace_paris_in_line(a_line):
                 yield a_pair
 
     def yield_lines(self):
-        if self._raw_input is not None:
+        if self._raw_input is not None or self._stream_input is not None:
             for a_line in self._yield_raw_lines():
                 yield a_line
         else:
             for a_line in self._yield_file_lines():
                 yield a_line
 
+    def replay_lines(self):
+        if self._raw_input is not None or self._stream_input is not None:
+            for a_line in self._yield_raw_lines():
+                yield a_line
+        else:
+            for a_line in self._replay_file_lines():
+                yield a_line
+
+    def stream_lines(self):
+        """
+        Same as yield_lines(), but the lines of stream input are not kept to be replayed, so memory does
+        not grow with the size of the input. Stream input can be read this way just once.
+        """
+        if self._stream_input is not None and self._raw_lines is None:
+            for a_line in self._stream_input:
+                yield a_line.rstrip()
+        else:
+            for a_line in self.yield_lines():
+                yield a_line
+
+    def yield_range_lines(self, start, end):
+        """
+        File input only. It yields the lines starting in the byte range [start, end) of the file.
+
+        :param start: byte offset of the beginning of a line
+        :param end: byte offset
+        :return:
+        """
+        with open(self._file_input, "rb") as in_stream:
+            in_stream.seek(start)
+            position = start
+            while position < end:
+                a_line = in_stream.readline()
+                if len(a_line) == 0:
+                    return
+                position += len(a_line)
+                yield a_line.decode("utf-8").rstrip()
+
+    def yield_prefix_namespace_pairs_with_offsets(self):
+        """
+        File input only. It yields (byte offset of the line, prefix, namespace) for each prefix declared.
+        Declarations are looked for in a memory map of the file, so just the lines declaring prefixes
+        are decoded.
+        """
+        if self._PREFIX_NEEDLE is None:
+            return
+        with open(self._file_input, "rb") as in_stream:
+            if os.fstat(in_stream.fileno()).st_size == 0:
+                return
+            with mmap.mmap(in_stream.fileno(), 0, access=mmap.ACCESS_READ) as mapped_input:
+                position = mapped_input.find(self._PREFIX_NEEDLE)
+                while position != -1:
+                    line_start = mapped_input.rfind(b"\n", 0, position) + 1
+                    line_end = mapped_input.find(b"\n", position)
+                    line_end = len(mapped_input) if line_end == -1 else line_end
+                    a_line = mapped_input[line_start:line_end].decode("utf-8").rstrip()
+                    for a_prefix, a_namespace in self.yield_prefix_namespace_pairs_in_line(a_line):
+                        yield line_start, a_prefix, a_namespace
+                    position = mapped_input.find(self._PREFIX_NEEDLE, line_end)
+
     def _yield_raw_lines(self):
-        for a_line in self._raw_input.split("\n"):
-            yield a_line.rstrip()
+        if self._raw_lines is None and self._stream_input is not None:
+            for a_line in self._read_stream_lines():
+                yield a_line
+            return
+        if self._raw_lines is None:
+            self._raw_lines = [a_line.rstrip() for a_line in self._raw_input.split("\n")]
+        for a_line in self._raw_lines:
+            yield a_line
+
+    def _read_stream_lines(self):
+        # Lines are yielded as soon as they are read, and kept to be replayed later
+        self._raw_lines = []
+        for a_line in self._stream_input:
+            a_line = a_line.rstrip()
+            self._raw_lines.append(a_line)
+            yield a_line
 
     def _yield_file_lines(self):
-        with open(self._file_input, encoding="utf-8") as in_stream:
+        # newline="\n" makes lines match the ones replayed from the memory map
+        with open(self._file_input, encoding="utf-8", newline="\n") as in_stream:
             for a_line in in_stream:
                 yield a_line.rstrip()
 
+    def _replay_file_lines(self):
+        with open(self._file_input, "rb") as in_stream:
+            if os.fstat(in_stream.fileno()).st_size == 0:
+                return  # Empty files can not be mapped
+            with mmap.mmap(in_stream.fileno(), 0, access=mmap.ACCESS_READ) as mapped_input:
+                for a_line in iter(mapped_input.readline, b""):
+                    yield a_line.decode("utf-8").rstrip()
+
+    def _may_declare_prefix(self, a_line):
+        raise NotImplementedError()
+
     def _yield_prefix_namespace_paris_in_line(self, a_line):
         raise NotImplementedError()
 
@@ -57,8 +180,10 @@ _TURTLE_NAMESPACE_SPEC = re.compile("<[^ <>]+>")
 
 class TurtleToyParser(AbstractParser):
 
-    def __init__(self, raw_input, file_input):
-        super().__init__(raw_input, file_input)
+    _PREFIX_NEEDLE = b"@prefix "
+
+    def __init__(self, raw_input, file_input, stream_input=None):
+        super().__init__(raw_input, file_input, stream_input)
 
     def _yield_prefix_namespace_paris_in_line(self, a_line):
         for a_match in re.finditer(_TURTLE_PREFIX, a_line):
@@ -69,25 +194,42 @@ class TurtleToyParser(AbstractParser):
             namespace = piece[namespace.start() + 1:namespace.end() - 1]  # Remove corners
             yield prefix, namespace
 
+    def _may_declare_prefix(self, a_line):
+        return "@prefix " in a_line
+
     def is_prefix_line(self, a_line):
         return a_line.startswith("@prefix ")
 
 
 
-_SHEXC_PREFIX = re.compile("(^| )PREFIX ")
-_SHEXC_PREFIX_SPEC = re.compile("([a-zA-Z]([a-zA-Z0-9\-]*[a-zA-Z0-9]+)?)? *: ")
-_SHEXC_NAMESPACE_SPEC = re.compile("<[^ <>]+>")
+class NTriplesToyParser(AbstractParser):
+    """
+    N-Triples has no prefixes: every IRI is written in full, one triple per line
+    """
 
-_NO_LABEL = "(no label available)"
-_MAX_IDS_PER_API_CALL = 49
+    def __init__(self, raw_input, file_input, stream_input=None):
+        super().__init__(raw_input, file_input, stream_input)
 
-_ENTITIES_API_CALL = "https://www.wikidata.org/w/api.php?action=wbgetentities&props=labels&ids={}&languages={}&format=json"
+    def _yield_prefix_namespace_paris_in_line(self, a_line):
+        return iter(())
 
+    def _may_declare_prefix(self, a_line):
+        return False
+
+    def is_prefix_line(self, a_line):
+        return False
+
+
+_SHEXC_PREFIX = re.compile("(^| )PREFIX ")
+_SHEXC_PREFIX_SPEC = re.compile("([a-zA-Z]([a-zA-Z0-9\-]*[a-zA-Z0-9]+)?)? *: ")
+_SHEXC_NAMESPACE_SPEC = re.compile("<[^ <>]+>")
 
 class ShExCToyParser(AbstractParser):
 
-    def __init__(self, raw_input, file_input):
-        super().__init__(raw_input, file_input)
+    _PREFIX_NEEDLE = b"PREFIX "
+
+    def __init__(self, raw_input, file_input, stream_input=None):
+        super().__init__(raw_input, file_input, stream_input)
 
     def _yield_prefix_namespace_paris_in_line(self, a_line):
         for a_match in re.finditer(_SHEXC_PREFIX, a_line):
@@ -98,61 +240,191 @@ class ShExCToyParser(AbstractParser):
             namespace = piece[namespace.start() + 1:namespace.end() - 1]  # Remove corners
             yield prefix, namespace
 
+    def _may_declare_prefix(self, a_line):
+        return "PREFIX " in a_line
+
     def is_prefix_line(self, a_line):
         return a_line.startswith("PREFIX ")
 
 
 ######## FORMATTERS
 
+def _is_out_path(out_file):
+    # Results can be written to a disk path or to a file-like object
+    return isinstance(out_file, (str, os.PathLike))
+
+
 _ARROW = " --> "
 _SEP_SPACES = "    "
+_WRITE_BUFFER_CHARS = 1 << 16
+_ANNOTATION_ITEM = re.compile(r"([QP][0-9]+)  -->  (.*?)(?= ; [QP][0-9]+  -->  |$)")  # As in _turn_id_into_comment
 
 
 class BaseFormater(object):
 
-    def __init__(self, out_file, string_return, parser, line_mentions_dict, chars_till_comment,
-                 ids_dict, mode_column_aligned):
+    _OWN_ANNOTATION = None  # Regex matching a line annotated by this formatter. Groups "body" and "comments"
+
+    def __init__(self, out_file, string_return, parser, mention_index, chars_till_comment,
+                 ids_dict, mode_column_aligned, strip_own_annotations=False, alignment_block_lines=None):
         self._out_file = out_file
         self._string_return = string_return
         self._parser = parser
-        self._line_mentions_dict = line_mentions_dict
+        self._mention_index = mention_index
         self._chars_till_comment = chars_till_comment
         self._ids_dict = ids_dict
         self._mode_column_aligned = mode_column_aligned
+        self._strip_own_annotations = strip_own_annotations
+        self._alignment_block_lines = alignment_block_lines if mode_column_aligned else None
 
         self._accumulated_result = None
         self._out_stream = None
+        self._owns_out_stream = False
+        self._text_out_stream = True
+        self._pending_lines = []
+        self._pending_chars = 0
+        self._header_written = False
+        self._block = []  # (line, comments) of the block being aligned, when aligning by blocks
 
     def produce_result(self):
+        self._write_lines(self.yield_result_lines())
+        return self.finish()
+
+    def yield_result_lines(self):
+        """
+        It yields the annotated lines of the whole content one by one, without line breaks.
+        """
+        for a_line in self._yield_header_once():
+            yield a_line
+        for a_line in self._yield_annotated_lines(lines=self._parser.replay_lines(),
+                                                  mention_index=self._mention_index):
+            yield a_line
+        for a_line in self._yield_block():
+            yield a_line
+
+    def write_window(self, lines, mention_index, chars_till_comment):
+        """
+        Streaming mode: it writes a window of lines of the content, just after the previous one.
+        Call finish() after the last window.
+
+        :param lines: list of lines of the window
+        :param mention_index: MentionIndex of the window. Its line numbers start at 0 in every window
+        :param chars_till_comment: column in which the comments of this window start
+        :return:
+        """
+        self._write_lines(self.yield_window_lines(lines=lines,
+                                                  mention_index=mention_index,
+                                                  chars_till_comment=chars_till_comment))
+
+    def yield_window_lines(self, lines, mention_index, chars_till_comment):
+        """
+        Same as write_window, but yielding the annotated lines instead of writing them.
+        """
+        self._chars_till_comment = chars_till_comment
+        for a_line in self._yield_header_once():
+            yield a_line
+        for a_line in self._yield_annotated_lines(lines=lines,
+                                                  mention_index=mention_index):
+            yield a_line
+
+    def yield_final_lines(self):
+        """
+        Streaming mode: lines to add after the last window. The header, if there were no windows at all,
+        and the lines of the last block, if aligning by blocks.
+        """
+        for a_line in self._yield_header_once():
+            yield a_line
+        for a_line in self._yield_block():
+            yield a_line
+
+    def finish(self):
+        self._write_lines(self.yield_final_lines())
+        self._tear_down()
+        return self._return_result()
+
+    def _yield_header_once(self):
+        if not self._header_written:
+            self._header_written = True
+            for a_line in self._yield_header():
+                yield a_line
+
+    def _yield_annotated_lines(self, lines, mention_index):
+        annotated_lines = mention_index.yield_line_mentions()
+        next_annotated, next_mentions = next(annotated_lines, (None, None))
         line_counter = 0
-        for a_line in self._parser.yield_lines():
-            if line_counter in self._line_mentions_dict:
-                self._write_line_with_comments(line=a_line,
-                                               comments=self._turn_entities_into_comments(
-                                                   self._line_mentions_dict[line_counter])
-                                               )
+        for a_line in lines:
+            if self._strip_own_annotations:
+                a_line = _split_own_annotation(a_line)[0]
+            if line_counter == next_annotated:
+                comments = self._turn_entities_into_comments(next_mentions)
+                next_annotated, next_mentions = next(annotated_lines, (None, None))
             else:
-                self._write_line(line=a_line)
+                comments = None
             line_counter += 1
-        self._tear_down()
-        return self._return_result()
+            if self._alignment_block_lines is None:
+                yield a_line if comments is None else self._add_comments_to_line(line=a_line,
+                                                                                 comments=comments)
+                continue
+            # Comments are already built, so a block may be completed by the lines of the next window
+            self._block.append((a_line, comments))
+            if a_line.strip() == "" or len(self._block) == self._alignment_block_lines:
+                for an_aligned_line in self._yield_block():
+                    yield an_aligned_line
+
+    def _yield_block(self):
+        # Lines of the block, with their comments starting in the same column. A block ends with a
+        # blank line, so paragraphs (usually a shape or the triples of a subject) are aligned on their own
+        if len(self._block) == 0:
+            return
+        self._chars_till_comment = 2 + max((len(a_line) for a_line, _ in self._block
+                                            if not self._parser.is_prefix_line(a_line)), default=0)
+        for a_line, comments in self._block:
+            yield a_line if comments is None else self._add_comments_to_line(line=a_line,
+                                                                             comments=comments)
+        self._block = []
+
+    def _yield_header(self):
+        return iter(())  # Lines to add before the content, if any
+
+    @classmethod
+    def split_annotation(cls, a_line):
+        """
+        It recognises an annotation previously produced by this kind of formatter at the end of a line.
+
+        :param a_line: str
+        :return: tuple (line without the annotation, dict id --> label annotated). The dict is None if the
+                line was not annotated
+        """
+        a_match = cls._OWN_ANNOTATION.match(a_line)
+        if a_match is None:
+            return a_line, None
+        return a_match.group("body"), {an_id: a_label for an_id, a_label
+                                       in _ANNOTATION_ITEM.findall(a_match.group("comments"))}
 
     def set_up(self):
         if self._string_return:
             self._accumulated_result = []
         else:
             self._accumulated_result = None
-        if self._out_file is not None:
-            self._reset_file(self._out_file)
-            self._out_stream = open(self._out_file, "wa")
+        if self._out_file is None:
+            return
+        if _is_out_path(self._out_file):
+            self._out_stream = open(self._out_file, "w", encoding="utf-8")
+            self._owns_out_stream = True
+            self._text_out_stream = True
+        else:  # A file-like object provided by the caller
+            self._out_stream = self._out_file
+            self._owns_out_stream = False
+            self._text_out_stream = isinstance(self._out_file, io.TextIOBase) or hasattr(self._out_file, "encoding")
 
     def _tear_down(self):
-        if self._out_file is not None:
+        if self._out_stream is None:
+            return
+        self._flush_pending()
+        if self._owns_out_stream:
             self._out_stream.close()
-
-    def _reset_file(self, out_file):
-        with open(out_file, "w") as out_stream:
-            out_stream.write("")
+        elif hasattr(self._out_stream, "flush"):
+            self._out_stream.flush()  # Do not close it, the caller may keep writing
+        self._out_stream = None
 
     def _turn_entities_into_comments(self, entity_mentions):
         if len(entity_mentions) == 0:
@@ -168,15 +440,24 @@ class BaseFormater(object):
                                  _ARROW,
                                  label)
 
-    def _write_line_with_comments(self, line, comments):
-        self._write_line(self._add_comments_to_line(line=line,
-                                                    comments=comments))
-
-    def _write_line(self, line):
-        if self._accumulated_result is not None:
-            self._accumulated_result.append(line)
-        if self._out_stream is not None:
-            self._out_stream.write(line + "\n")
+    def _write_lines(self, lines):
+        for a_line in lines:
+            if self._accumulated_result is not None:
+                self._accumulated_result.append(a_line)
+            if self._out_stream is not None:
+                # Lines are written in big chunks instead of one by one
+                self._pending_lines.append(a_line)
+                self._pending_chars += len(a_line) + 1
+                if self._pending_chars >= _WRITE_BUFFER_CHARS:
+                    self._flush_pending()
+
+    def _flush_pending(self):
+        if len(self._pending_lines) == 0:
+            return
+        chunk = "\n".join(self._pending_lines) + "\n"
+        self._out_stream.write(chunk if self._text_out_stream else chunk.encode("utf-8"))
+        self._pending_lines = []
+        self._pending_chars = 0
 
     def _return_result(self):
         if self._string_return:
@@ -193,20 +474,25 @@ class BaseFormater(object):
 
 
 _RDFS_NAMESPACE = "http://www.w3.org/2000/01/rdf-schema#"
+_RDFS_HEADER = re.compile(r"^PREFIX (?P<prefix>[^ :]*): <" + re.escape(_RDFS_NAMESPACE) + ">$")  # As in _yield_header
 
 
 class RdfsCommentFormatter(BaseFormater):
 
+    _OWN_ANNOTATION = re.compile(r'^(?P<body>.*?) +// [^ :]*:comment "(?P<comments>[QP][0-9]+  -->  .*)"$')
+
     def __init__(self, out_file, string_return, parser,
-                 line_mentions_dict, chars_till_comment, ids_dict,
-                 namespaces_dict, mode_column_aligned):
+                 mention_index, chars_till_comment, ids_dict,
+                 namespaces_dict, mode_column_aligned, strip_own_annotations=False, alignment_block_lines=None):
         super().__init__(out_file=out_file,
                          string_return=string_return,
                          parser=parser,
-                         line_mentions_dict=line_mentions_dict,
+                         mention_index=mention_index,
                          chars_till_comment=chars_till_comment,
                          ids_dict=ids_dict,
-                         mode_column_aligned=mode_column_aligned)
+                         mode_column_aligned=mode_column_aligned,
+                         strip_own_annotations=strip_own_annotations,
+                         alignment_block_lines=alignment_block_lines)
 
         self._rdfs_prefix = None
         self._added_rdfs = False
@@ -235,53 +521,183 @@ class RdfsCommentFormatter(BaseFormater):
         return line + self._propper_amount_of_spaces(len(line)) + '// {}:comment "{}"'.format(self._rdfs_prefix,
                                                                                               " ; ".join(comments))
 
-    def produce_result(self):
+    def _yield_header(self):
         if self._added_rdfs:
-            self._write_line("PREFIX {}: <{}>".format(self._rdfs_prefix, _RDFS_NAMESPACE))
-        return super().produce_result()
+            yield "PREFIX {}: <{}>".format(self._rdfs_prefix, _RDFS_NAMESPACE)
 
 
 class RawCommentsFormatter(BaseFormater):
 
-    def __init__(self, out_file, string_return, parser, line_mentions_dict,
-                 chars_till_comment, ids_dict, mode_column_aligned):
+    _OWN_ANNOTATION = re.compile(r"^(?P<body>.*?) +# (?P<comments>[QP][0-9]+  -->  .*)$")
+
+    def __init__(self, out_file, string_return, parser, mention_index,
+                 chars_till_comment, ids_dict, mode_column_aligned, strip_own_annotations=False,
+                 alignment_block_lines=None):
         super().__init__(out_file=out_file,
                          string_return=string_return,
                          parser=parser,
-                         line_mentions_dict=line_mentions_dict,
+                         mention_index=mention_index,
                          chars_till_comment=chars_till_comment,
                          ids_dict=ids_dict,
-                         mode_column_aligned=mode_column_aligned)
+                         mode_column_aligned=mode_column_aligned,
+                         strip_own_annotations=strip_own_annotations,
+                         alignment_block_lines=alignment_block_lines)
 
     def _add_comments_to_line(self, line, comments):
         return line + self._propper_amount_of_spaces(len(line)) + "# " + " ; ".join(comments)
 
-_CLOSING_MENTION_CHARS = ['?','*','+',';',',','.',')',']']
+
+def _split_own_annotation(a_line):
+    # Annotations of both kinds are recognised, so switching between raw and rdfs comments replaces them
+    for a_formatter_class in (RdfsCommentFormatter, RawCommentsFormatter):
+        body, labels = a_formatter_class.split_annotation(a_line)
+        if labels is not None:
+            return body, labels
+    return a_line, None
+
+######## MENTIONS SCANNING
+
+_OPENING_MENTION_CONTEXT = r"(?:^|(?<=[ (\[]))"  # Line start, or preceded by one of ' ', '(', '['
+_CLOSING_MENTION_CONTEXT = r"(?=[ ?*+;,.)\]])"  # Followed by one of ' ', '?', '*', '+', ';', ',', '.', ')', ']'
+_MAX_SHARED_SCANNERS = 64
+_MIN_CHUNK_BYTES = 4 << 20  # Smaller chunks are not worth sending to other process
+_CHUNKS_PER_PROCESS = 4  # Several chunks per process balance the load when some of them have more mentions
+
+
+class _MentionScanner(object):
+    """
+    Single regex (an alternation of named groups, each one capturing a wikidata id) plus a list
+    of literal needles. A line containing none of the needles can not contain a mention, so the
+    regex is not even executed for it.
+    """
+
+    def __init__(self, alternatives):
+        """
+
+        :param alternatives: list of (regex, needle) pairs. Each regex must contain exactly one
+                named group capturing the id
+        """
+        self._pattern = re.compile("|".join(a_regex for a_regex, _ in alternatives))
+        self._needles = tuple(a_needle for _, a_needle in alternatives)
+
+    def find_mentions(self, a_line):
+        """
+
+        :param a_line: str
+        :return: dict whose keys are the distinct ids mentioned, in order of first appearance. Unlike
+                a set, the order does not depend on the hash seed, so comments are the same in every execution
+        """
+        for a_needle in self._needles:
+            if a_needle in a_line:
+                return dict.fromkeys(a_match.group(a_match.lastindex) for a_match in self._pattern.finditer(a_line))
+        return {}
+
+
+@functools.lru_cache(maxsize=_MAX_SHARED_SCANNERS)
+def _scanner_of(alternatives):
+    # Scanners are immutable, so every WLighter using the same namespaces and prefixes shares them
+    # instead of compiling its own
+    return _MentionScanner(alternatives)
+
 
 class WLighter(object):
 
     def __init__(self, raw_input=None, file_input=None, format=SHEXC_FORMAT, languages=None,
-                 generate_rdfs_comments=False, mode_column_aligned=True):
+                 generate_rdfs_comments=False, mode_column_aligned=True, cache_file=None,
+                 cache_ttl=DEFAULT_CACHE_TTL, cache_max_entries=DEFAULT_CACHE_MAX_ENTRIES,
+                 max_concurrent_calls=DEFAULT_MAX_CONCURRENT_CALLS, label_index=None, incremental=False,
+                 api_url=None, stats_hook=None, api_max_retries=DEFAULT_MAX_RETRIES, api_maxlag=DEFAULT_MAXLAG,
+                 async_api_client=None, stream_window=None, resolver_chain=None, property_snapshot=None,
+                 scan_processes=None, alignment_block_lines=None, stream_input=None):
 
         """
 
         :param raw_input: provide here the content to be annotated as a regular str
         :param file_input: provide here some path file where the content to be annotated is placed
-        :param format: choose between ShExC or turtle. Use the constS SHEXC_FORMAT or TURTLE_FORMAT
+        :param format: choose between ShExC, turtle or N-Triples. Use the consts SHEXC_FORMAT, TURTLE_FORMAT or
+                NTRIPLES_FORMAT
         :param languages: list with sorted preferredn languages. ["en"] will be used if no value is provided
         :param generate_rdfs_comments: se to True to generate rdfs:comments with "//" instead of regular comments with "#"
         :param mode_column_aligned: by default, all the comments start in the same column. This can be ugly in case of
                 having too large files. Set this param to False to place the comments a fixed ammount of spaces far
                 from its line
+        :param cache_file: disk path of a file to persist the labels obtained from wikidata between executions.
+                If None, the labels are cached in memory just while this object lives
+        :param cache_ttl: seconds during which a cached label is considered valid. None means no expiration
+        :param cache_max_entries: max number of labels kept in the cache. None means no limit
+        :param max_concurrent_calls: max number of requests to the wikidata API running at a time. The ids
+                to solve are sent in batches, which are distributed among this number of threads
+        :param label_index: disk path of a label index built from a wikidata dump (see wlighter.dump_index).
+                If provided, labels are taken from it and the wikidata API is not used at all. The index must
+                have been built with the same languages
+        :param incremental: set to True to re-annotate content previously annotated by wLighter. Annotations already
+                present are recognised and replaced instead of duplicated. When writing to out_file, a sidecar
+                manifest (out_file + ".wlmanifest") is stored, so later executions on unchanged content are skipped,
+                and the labels of the lines whose mentions did not change are reused without asking wikidata (as long
+                as the settings did not change either). In this mode, the input file can be used as out_file too
+        :param api_url: URL of the wikidata API (api.php) to ask for labels. The public wikidata endpoint is used
+                if None
+        :param stats_hook: optional callable, called as stats_hook(event, data) at the end of each phase of an
+                annotation and after each request to the wikidata API. See AnnotationStats
+        :param api_max_retries: max number of times a failed request to the wikidata API is retried. Ids that can
+                not be solved after that are annotated as having no label
+        :param api_maxlag: maxlag parameter sent to the wikidata API, so it can ask us to wait when its servers
+                are lagged. None to not send it
+        :param async_api_client: AsyncWikidataApiClient used by the *_async methods. Share the same one among
+                the WLighter objects working in an event loop, so they share its connections. If None, each
+                async annotation opens its own client (using api_url, max_concurrent_calls, api_max_retries
+                and api_maxlag) and closes it when it is done
+        :param stream_window: number of lines per window in streaming mode. If provided, the content is
+                processed window by window: the mentions of a window are scanned and solved, and its lines
+                are written before reading the next one, so memory does not grow with the size of the input
+                (as long as string_return is False). Labels already obtained are taken from the cache instead
+                of being asked again. With mode_column_aligned, comments are aligned within each window.
+                When generating rdfs comments, just the prefixes declared in the first window are considered
+                to choose the rdfs prefix. It can not be combined with incremental
+        :param resolver_chain: ResolverChain solving the labels (see wlighter.resolvers), to put your own
+                tiers in front of the wikidata API or to share a chain among several WLighter objects. If None,
+                a chain is built with the property snapshot, the label index, the label cache and the wikidata
+                API, in that order. If provided, cache_*, label_index and property_snapshot params are ignored,
+                and max_concurrent_calls and api_* are used just to open the client of the *_async methods
+        :param property_snapshot: disk path of a snapshot of property labels (see wlighter.property_snapshot).
+                Properties found in it are solved offline, and just the rest of ids are asked to the label
+                index, the cache or the wikidata API. It must include every language requested
+        :param scan_processes: number of processes used to look for mentions in file_input. The file is split
+                in chunks of whole lines, which are scanned in parallel. Worth it just for large files.
+                None to scan in this process. Not used in incremental or streaming modes
+        :param alignment_block_lines: with mode_column_aligned, comments are aligned within each block of
+                lines instead of in the whole content. A block ends with a blank line (usually, after a shape
+                or the triples of a subject) or when it reaches this number of lines, and it is written as soon
+                as it is complete. Combined with stream_window, the first lines are written once the first
+                window is solved, and blocks are not cut at the end of the windows. None to align the whole
+                content (or each window, in streaming mode)
+        :param stream_input: provide here a text file-like object (sys.stdin, for example) to read the content
+                from, line by line, instead of raw_input or file_input. It is read just once: lines are kept in
+                memory to write the result, unless stream_window is provided. It can not be combined with
+                incremental
         """
+        if stream_window is not None and stream_window < 1:
+            raise ValueError("stream_window must be a positive integer")
+        if stream_window is not None and incremental:
+            raise ValueError("Streaming mode can not be combined with incremental annotation")
+        if alignment_block_lines is not None and alignment_block_lines < 1:
+            raise ValueError("alignment_block_lines must be a positive integer")
+        if stream_input is not None and incremental:
+            raise ValueError("Stream input can not be combined with incremental annotation")
         self._raw_input = raw_input
         self._file_input = file_input
         self._format = format
         self._languages = ["en"] if languages is None else languages
         self._generate_rdfs_comments = generate_rdfs_comments
         self._mode_column_aligned = mode_column_aligned
-
-        self._parser = self._choose_parser()
+        self._incremental = incremental
+        self._stream_window = stream_window
+        self._scan_processes = scan_processes
+        self._alignment_block_lines = alignment_block_lines
+
+        self._parser = self._choose_parser(raw_input=raw_input,
+                                           file_input=file_input,
+                                           stream_input=stream_input)
         self._formatter = None  # Will be Chosen later
 
         self._namespaces = None
@@ -291,110 +707,798 @@ class WLighter(object):
         self._namespace_direct_prop = _PROP_DIRECT
         self._namespace_indirect_prop = _PROP_INDIRECT
 
-        self._entity_full_pattern = None
-        self._entity_prefixed_pattern = None
-        self._prop_direct_full_pattern = None
-        self._prop_direct_prefixed_pattern = None
-        self._prop_indirect_full_pattern = None
-        self._prop_indirect_prefixed_pattern = None
+        self._entity_scanner = None
+        self._prop_scanner = None
+        self._all_scanner = None
         self._languages_for_api = self._build_languages_for_api()
 
-        self._cache = {}
+        self._api_url = api_url
+        self._max_concurrent_calls = max_concurrent_calls
+        self._api_max_retries = api_max_retries
+        self._api_maxlag = api_maxlag
+        self._async_api_client = async_api_client
+        self._cache = None
+        if resolver_chain is not None:  # Nothing to build: labels are solved elsewhere
+            self._resolver_chain = resolver_chain
+        else:
+            self._resolver_chain = self._build_resolver_chain(cache_file=cache_file,
+                                                              cache_ttl=cache_ttl,
+                                                              cache_max_entries=cache_max_entries,
+                                                              label_index=label_index,
+                                                              property_snapshot=property_snapshot)
 
-        self._line_mentions_dict = {}
+        self._mention_index = MentionIndex()
         self._ids_dict = {}
+        self._unsolved_ids = set()  # Ids annotated as NO_LABEL because no tier could solve them
+
+        self._stats_hook = stats_hook
+        self._stats = AnnotationStats(hook=stats_hook)
+
+    @property
+    def stats(self):
+        """
+        AnnotationStats of the last annotation: time spent in each phase, lines scanned, mentions found,
+        distinct ids, requests sent to wikidata, bytes received, cache hits...
+        """
+        return self._stats
+
+    @property
+    def cache(self):
+        """
+        LabelCache used to avoid repeated calls to the wikidata API. Check its hits and misses attributes
+        to know how useful it is being. None if a resolver_chain was provided.
+        """
+        return self._cache
+
+    @property
+    def resolver_chain(self):
+        """
+        ResolverChain solving the labels. Check its tier_stats() to know the latency and hit rate of each tier.
+        """
+        return self._resolver_chain
+
+    def annotate(self, out_file=None, string_return=True, target=ANNOTATE_ALL):
+        """
+        It annotates the ids chosen by target. Useful when the target is not known beforehand.
+
+        :param out_file: path file or file-like object (text or binary) to write the results
+        :param string_return: set to True to make this method return the results as an str
+        :param target: choose what to annotate. Use the consts ANNOTATE_ENTITIES, ANNOTATE_PROPERTIES or ANNOTATE_ALL
+        :return:
+        """
+        return self._base_annotate(out_file=out_file,
+                                   string_return=string_return,
+                                   target=target)
 
     def annotate_entities(self, out_file=None, string_return=True):
         """
         It annotates just entities
 
-        :param out_file: path file to write the results
+        :param out_file: path file or file-like object (text or binary) to write the results
         :param string_return: set to True to make this method return the results as an str
         :return:
         """
         return self._base_annotate(out_file=out_file,
                                    string_return=string_return,
-                                   look_for_mentions_func=self._look_for_entity_mentions)
+                                   target=ANNOTATE_ENTITIES)
 
     def annotate_properties(self, out_file=None, string_return=True):
         """
         It annotates just properties
 
-        :param out_file: path file to write the results
+        :param out_file: path file or file-like object (text or binary) to write the results
         :param string_return: set to True to make this method return the results as an str
         :return:
         """
         return self._base_annotate(out_file=out_file,
                                    string_return=string_return,
-                                   look_for_mentions_func=self._look_for_prop_mentions)
+                                   target=ANNOTATE_PROPERTIES)
 
     def annotate_all(self, out_file=None, string_return=True):
         """
         It annotates both entities and properties
 
-        :param out_file: path file to write the results
+        :param out_file: path file or file-like object (text or binary) to write the results
         :param string_return: set to True to make this method return the results as an str
         :return:
         """
         return self._base_annotate(out_file=out_file,
                                    string_return=string_return,
-                                   look_for_mentions_func=self._look_for_all_mentions)
+                                   target=ANNOTATE_ALL)
+
+    def yield_annotated_lines(self, target=ANNOTATE_ALL):
+        """
+        It annotates the content and yields the annotated lines one by one, without line breaks, instead of
+        building the whole result. In streaming mode, each window is read and solved once the lines of the
+        previous one have been consumed.
+
+        :param target: choose what to annotate. Use the consts ANNOTATE_ENTITIES, ANNOTATE_PROPERTIES or ANNOTATE_ALL
+        :return: generator of str
+        """
+        if self._stream_window is not None:
+            for a_window, max_lenght in self._yield_solved_windows(out_file=None,
+                                                                   string_return=False,
+                                                                   target=target):
+                for a_line in self._formatter.yield_window_lines(lines=a_window,
+                                                                 mention_index=self._mention_index,
+                                                                 chars_till_comment=max_lenght + 2):
+                    yield a_line
+            for a_line in self._formatter.yield_final_lines():
+                yield a_line
+            return
+        if self._incremental:
+            _, _, _, max_lenght = self._plan_incremental(out_file=None,
+                                                         target=target)
+            with self._stats.phase(PHASE_RESOLVE):
+                self._solve_mentions()
+            self._set_incremental_formatter(out_file=None,
+                                            string_return=False,
+                                            max_length=max_lenght + 2)
+        else:
+            self._prepare_annotation(out_file=None,
+                                     string_return=False,
+                                     target=target)
+            with self._stats.phase(PHASE_RESOLVE):
+                self._solve_mentions()
+        for a_line in self._formatter.yield_result_lines():
+            yield a_line
+
+    async def annotate_entities_async(self, out_file=None, string_return=True):
+        """
+        Same as annotate_entities, but it does not block the event loop: labels are asked to wikidata with
+        a non-blocking client, and reading, scanning and writing the content run in worker threads.
+        Do not run several annotations of the same WLighter object at a time.
+
+        :param out_file: path file or file-like object (text or binary) to write the results
+        :param string_return: set to True to make this method return the results as an str
+        :return:
+        """
+        return await self._base_annotate_async(out_file=out_file,
+                                               string_return=string_return,
+                                               target=ANNOTATE_ENTITIES)
+
+    async def annotate_properties_async(self, out_file=None, string_return=True):
+        """
+        Same as annotate_properties, but it does not block the event loop. See annotate_entities_async
+
+        :param out_file: path file or file-like object (text or binary) to write the results
+        :param string_return: set to True to make this method return the results as an str
+        :return:
+        """
+        return await self._base_annotate_async(out_file=out_file,
+                                               string_return=string_return,
+                                               target=ANNOTATE_PROPERTIES)
+
+    async def annotate_all_async(self, out_file=None, string_return=True):
+        """
+        Same as annotate_all, but it does not block the event loop. See annotate_entities_async
+
+        :param out_file: path file or file-like object (text or binary) to write the results
+        :param string_return: set to True to make this method return the results as an str
+        :return:
+        """
+        return await self._base_annotate_async(out_file=out_file,
+                                               string_return=string_return,
+                                               target=ANNOTATE_ALL)
+
+    def annotate_in_languages(self, languages_chains, out_files=None, string_return=True, target=ANNOTATE_ALL):
+        """
+        It produces an annotated version of the content per chain of languages. The content is scanned
+        once and the labels of every chain are obtained in the same requests to wikidata.
+        Not available in incremental or streaming modes.
+
+        :param languages_chains: list of lists of sorted preferred languages, e.g. [["es"], ["fr", "es"], ["en"]]
+        :param out_files: list of path files or file-like objects to write the results, one per chain. None to not write them
+        :param string_return: set to True to make this method return the results as strs
+        :param target: choose what to annotate. Use the consts ANNOTATE_ENTITIES, ANNOTATE_PROPERTIES or ANNOTATE_ALL
+        :return: list with a result per chain, in the same order as languages_chains
+        """
+        if self._incremental or self._stream_window is not None:
+            raise ValueError("Annotating in several languages at a time is not available in incremental or "
+                             "streaming modes")
+        out_files = [None] * len(languages_chains) if out_files is None else out_files
+        if len(out_files) != len(languages_chains):
+            raise ValueError("Please, provide an out file per chain of languages")
+        for an_out_file in out_files:
+            self._check_out_file(an_out_file)
+        self._set_up(out_file=None)
+        with self._stats.phase(PHASE_SCAN):
+            max_lenght = self._scan_content(target)
+        with self._stats.phase(PHASE_RESOLVE):
+            ids_dicts = self._solve_mentions_in_languages(languages_chains)
+        result = []
+        with self._stats.phase(PHASE_OUTPUT):
+            for an_out_file, an_ids_dict in zip(out_files, ids_dicts):
+                self._ids_dict = an_ids_dict
+                self._set_formatter(an_out_file, string_return, max_lenght + 2)
+                result.append(self._formatter.produce_result())
+        return result
 
-    def _base_annotate(self, out_file, string_return, look_for_mentions_func):
+    def annotate_many(self, paths, out_dir, target=ANNOTATE_ALL, processes=None):
+        """
+        It annotates several files at a time using the configuration of this object (format, languages,...).
+        The input content of this object, if any, is ignored. All the files are scanned first, and then
+        the ids mentioned in any of them are solved together, so each distinct id is solved just once.
+        Each result is written in out_dir using the same file name as its input.
+
+        :param paths: list of disk paths of the files to annotate
+        :param out_dir: directory in which the annotated files will be written. It is created if needed
+        :param target: choose what to annotate. Use the consts ANNOTATE_ENTITIES, ANNOTATE_PROPERTIES or ANNOTATE_ALL
+        :param processes: number of processes used to scan and to write the files. If None, everything is done
+                in this process
+        :return: list with the disk paths of the annotated files, in the same order as paths
+        """
+        self._choose_mentions_finder(target)  # Fail fast if the target is not valid
+        out_files = self._batch_out_files(paths=paths,
+                                          out_dir=out_dir)
+        for _ in self._yield_batch_results(paths=paths,
+                                           out_files=out_files,
+                                           target=target,
+                                           processes=processes):
+            pass
+        return out_files
+
+    def yield_many_annotated(self, paths, target=ANNOTATE_ALL, processes=None):
+        """
+        Same as annotate_many(), but the results are not written to disk: it yields the annotated content
+        of each file as a str, in the same order as paths.
+
+        :param paths: list of disk paths of the files to annotate
+        :param target: choose what to annotate. Use the consts ANNOTATE_ENTITIES, ANNOTATE_PROPERTIES or ANNOTATE_ALL
+        :param processes: number of processes used to scan and to annotate the files. If None, everything is done
+                in this process
+        :return: generator of str
+        """
+        self._choose_mentions_finder(target)
+        for a_result in self._yield_batch_results(paths=paths,
+                                                  out_files=[None] * len(paths),
+                                                  target=target,
+                                                  processes=processes):
+            yield a_result
+
+    def _yield_batch_results(self, paths, out_files, target, processes):
+        # It yields the result of each file (None if it is written to its out file), in the same order as paths
+        self._stats = AnnotationStats(hook=self._stats_hook)
+        if processes is None:
+            for a_result in self._yield_batch_results_with(map_func=map,
+                                                           paths=paths,
+                                                           out_files=out_files,
+                                                           target=target):
+                yield a_result
+            return
+        from concurrent.futures import ProcessPoolExecutor  # Slow to import, and seldom needed
+        with ProcessPoolExecutor(max_workers=processes) as executor:  # The same pool scans and writes the files
+            for a_result in self._yield_batch_results_with(map_func=executor.map,
+                                                           paths=paths,
+                                                           out_files=out_files,
+                                                           target=target):
+                yield a_result
+
+    def _yield_batch_results_with(self, map_func, paths, out_files, target):
+        with self._stats.phase(PHASE_SCAN):
+            scans = list(map_func(_scan_file_for_batch,
+                                  paths,
+                                  [self._format] * len(paths),
+                                  [self._languages] * len(paths),
+                                  [target] * len(paths)))
+            self._ids_dict = {}
+            for mention_index, _, _, lines_scanned in scans:
+                self._stats.lines_scanned += lines_scanned
+                self._stats.mentions_found += mention_index.n_mentions
+                for a_mention in mention_index.ids:
+                    if a_mention not in self._ids_dict:
+                        self._ids_dict[a_mention] = None
+        with self._stats.phase(PHASE_RESOLVE):
+            self._solve_mentions()
+
+        with self._stats.phase(PHASE_OUTPUT):
+            for an_out_dir in {os.path.dirname(an_out_file) for an_out_file in out_files if an_out_file is not None}:
+                os.makedirs(an_out_dir or ".", exist_ok=True)
+            # Each file gets just the labels it mentions
+            results = map_func(_write_file_for_batch,
+                               paths,
+                               out_files,
+                               [self._batch_settings()] * len(paths),
+                               [mention_index for mention_index, _, _, _ in scans],
+                               [namespaces for _, _, namespaces, _ in scans],
+                               [max_length + 2 for _, max_length, _, _ in scans],
+                               [{a_mention: self._ids_dict[a_mention] for a_mention in mention_index.ids}
+                                for mention_index, _, _, _ in scans])
+            for a_result in results:
+                yield a_result
+
+    def _batch_settings(self):
+        # Params of the WLighter objects writing the files of a batch
+        return {"format": self._format,
+                "languages": self._languages,
+                "generate_rdfs_comments": self._generate_rdfs_comments,
+                "mode_column_aligned": self._mode_column_aligned,
+                "alignment_block_lines": self._alignment_block_lines}
+
+    def _write_for_batch(self, out_file, mention_index, namespaces, max_length, labels):
+        self._ids_dict = labels
+        return self._build_formatter(out_file=out_file,
+                                     string_return=out_file is None,
+                                     parser=self._parser,
+                                     mention_index=mention_index,
+                                     namespaces_dict=namespaces,
+                                     max_length=max_length).produce_result()
+
+    def _batch_out_files(self, paths, out_dir):
+        result = []
+        for a_path in paths:
+            an_out_file = os.path.join(out_dir, os.path.basename(a_path))
+            if os.path.abspath(an_out_file) == os.path.abspath(a_path):
+                raise ValueError("Please, do not use the same disk path as input and output at a time: " + a_path)
+            if an_out_file in result:
+                raise ValueError("Several input files would be written to the same output file: " + an_out_file)
+            result.append(an_out_file)
+        return result
+
+    def _scan_for_batch(self, target):
+        self._set_up(out_file=None)
+        max_length = self._scan(look_for_mentions_func=self._choose_mentions_finder(target))
+        return self._mention_index, max_length, self._namespaces, self._stats.lines_scanned
+
+    def _choose_mentions_finder(self, target):
+        if target == ANNOTATE_ENTITIES:
+            return self._look_for_entity_mentions
+        elif target == ANNOTATE_PROPERTIES:
+            return self._look_for_prop_mentions
+        elif target == ANNOTATE_ALL:
+            return self._look_for_all_mentions
+        raise ValueError("Unsupported annotation target: " + str(target))
+
+    def _base_annotate(self, out_file, string_return, target):
+        if self._stream_window is not None:
+            return self._stream_annotate(out_file=out_file,
+                                         string_return=string_return,
+                                         target=target)
+        if self._incremental:
+            return self._incremental_annotate(out_file=out_file,
+                                              string_return=string_return,
+                                              target=target)
+        self._prepare_annotation(out_file=out_file,
+                                 string_return=string_return,
+                                 target=target)
+        with self._stats.phase(PHASE_RESOLVE):
+            self._solve_mentions()
+        with self._stats.phase(PHASE_OUTPUT):
+            return self._formatter.produce_result()
+
+    async def _base_annotate_async(self, out_file, string_return, target):
+        if self._async_api_client is not None:
+            return await self._annotate_async(out_file=out_file,
+                                              string_return=string_return,
+                                              target=target,
+                                              api_client=self._async_api_client)
+        async with AsyncWikidataApiClient(api_url=self._api_url,
+                                          max_concurrent_calls=self._max_concurrent_calls,
+                                          max_retries=self._api_max_retries,
+                                          maxlag=self._api_maxlag) as api_client:
+            return await self._annotate_async(out_file=out_file,
+                                              string_return=string_return,
+                                              target=target,
+                                              api_client=api_client)
+
+    async def _annotate_async(self, out_file, string_return, target, api_client):
+        # Same steps as _base_annotate and _incremental_annotate. Everything but the requests to wikidata
+        # touches the disk or is CPU bound, so it is moved out of the loop
+        if self._stream_window is not None:
+            # Windows are solved one after another, so there is nothing to overlap with the requests
+            return await _run_in_thread(self._stream_annotate,
+                                        out_file=out_file,
+                                        string_return=string_return,
+                                        target=target)
+        if self._incremental:
+            plan = await _run_in_thread(self._plan_incremental,
+                                        out_file=out_file,
+                                        target=target)
+            if plan is None:
+                return await _run_in_thread(self._skipped_result,
+                                            out_file=out_file,
+                                            string_return=string_return)
+            with self._stats.phase(PHASE_RESOLVE):
+                await self._solve_mentions_async(api_client)
+            with self._stats.phase(PHASE_OUTPUT):
+                return await _run_in_thread(self._write_incremental,
+                                            out_file=out_file,
+                                            string_return=string_return,
+                                            plan=plan)
+        await _run_in_thread(self._prepare_annotation,
+                             out_file=out_file,
+                             string_return=string_return,
+                             target=target)
+        with self._stats.phase(PHASE_RESOLVE):
+            await self._solve_mentions_async(api_client)
+        with self._stats.phase(PHASE_OUTPUT):
+            return await _run_in_thread(self._formatter.produce_result)
+
+    def _prepare_annotation(self, out_file, string_return, target):
         self._set_up(out_file)
+        with self._stats.phase(PHASE_SCAN):
+            max_lenght = self._scan_content(target)
+        self._set_formatter(out_file, string_return, max_lenght + 2)
+
+    def _scan_content(self, target):
+        if self._scan_processes is not None and self._file_input is not None:
+            return self._scan_in_parallel(target)
+        return self._scan(self._choose_mentions_finder(target))
+
+    def _scan_in_parallel(self, target):
+        ranges = self._chunk_ranges()
+        if len(ranges) < 2:
+            return self._scan(self._choose_mentions_finder(target))
+        # Prefixes are found first, so each chunk starts with the namespaces declared before it
+        declarations = list(self._parser.yield_prefix_namespace_pairs_with_offsets())
+        chunk_namespaces = []
+        next_declaration = 0
+        for start, _ in ranges:
+            while next_declaration < len(declarations) and declarations[next_declaration][0] < start:
+                _, a_prefix, a_namespace = declarations[next_declaration]
+                self._namespaces[a_namespace] = a_prefix
+                next_declaration += 1
+            chunk_namespaces.append(dict(self._namespaces))
+        for _, a_prefix, a_namespace in declarations[next_declaration:]:
+            self._namespaces[a_namespace] = a_prefix
+
+        from concurrent.futures import ProcessPoolExecutor  # Slow to import, and seldom needed
+        with ProcessPoolExecutor(max_workers=self._scan_processes) as executor:
+            scans = executor.map(_scan_file_range,
+                                 [self._file_input] * len(ranges),
+                                 [self._format] * len(ranges),
+                                 [self._languages] * len(ranges),
+                                 [target] * len(ranges),
+                                 [start for start, _ in ranges],
+                                 [end for _, end in ranges],
+                                 chunk_namespaces)
+            max_lenght = 0
+            line_offset = 0
+            for mention_index, chunk_max_length, lines_scanned in scans:
+                self._mention_index.extend(other=mention_index,
+                                           line_offset=line_offset)
+                line_offset += lines_scanned
+                max_lenght = max(max_lenght, chunk_max_length)
+        for a_mention in self._mention_index.ids:
+            self._ids_dict[a_mention] = None
+        self._stats.lines_scanned = line_offset
+        self._stats.mentions_found = self._mention_index.n_mentions
+        return max_lenght
+
+    def _chunk_ranges(self):
+        # Byte ranges [start, end) of the file, each one made of whole lines
+        size = os.path.getsize(self._file_input)
+        n_chunks = min(self._scan_processes * _CHUNKS_PER_PROCESS, size // _MIN_CHUNK_BYTES)
+        boundaries = [0]
+        if n_chunks > 1:
+            with open(self._file_input, "rb") as in_stream:
+                with mmap.mmap(in_stream.fileno(), 0, access=mmap.ACCESS_READ) as mapped_input:
+                    for i in range(1, n_chunks):
+                        line_end = mapped_input.find(b"\n", size * i // n_chunks)
+                        if line_end == -1:
+                            break
+                        if boundaries[-1] < line_end + 1 < size:
+                            boundaries.append(line_end + 1)
+        boundaries.append(size)
+        return list(zip(boundaries[:-1], boundaries[1:]))
+
+    def _scan_range(self, target, start, end, namespaces):
+        self._set_up(out_file=None)
+        self._namespaces = dict(namespaces)
+        self._reset_patterns()
+        self._compile_patterns()
+        max_lenght = self._scan_lines(lines=self._parser.yield_range_lines(start, end),
+                                      look_for_mentions_func=self._choose_mentions_finder(target))
+        return self._mention_index, max_lenght, self._stats.lines_scanned
+
+    def _stream_annotate(self, out_file, string_return, target):
+        for a_window, max_lenght in self._yield_solved_windows(out_file=out_file,
+                                                               string_return=string_return,
+                                                               target=target):
+            with self._stats.phase(PHASE_OUTPUT):
+                self._formatter.write_window(lines=a_window,
+                                             mention_index=self._mention_index,
+                                             chars_till_comment=max_lenght + 2)
+        with self._stats.phase(PHASE_OUTPUT):
+            return self._formatter.finish()
+
+    def _yield_solved_windows(self, out_file, string_return, target):
+        # It yields (window, max length) once its mentions are solved. The formatter is ready by then
+        self._set_up(out_file)
+        look_for_mentions_func = self._choose_mentions_finder(target)
+        for a_window in self._yield_windows():
+            self._mention_index = MentionIndex()
+            self._ids_dict.clear()  # The formatter keeps a reference to this same dict
+            with self._stats.phase(PHASE_SCAN):
+                max_lenght = self._scan_lines(lines=a_window,
+                                              look_for_mentions_func=look_for_mentions_func)
+            with self._stats.phase(PHASE_RESOLVE):
+                n_known = self._stats.cache_hits + self._stats.labels_reused
+                self._solve_mentions()
+            # Keeping every id of the stream to count them exactly would make memory grow with the input.
+            # Ids of previous windows are found in the cache, so just the ones missing there are counted
+            self._stats.distinct_ids += len(self._ids_dict) - (self._stats.cache_hits + self._stats.labels_reused
+                                                               - n_known)
+            if self._formatter is None:
+                self._set_formatter(out_file, string_return, max_lenght + 2)
+            yield a_window, max_lenght
+        if self._formatter is None:  # No lines at all
+            self._set_formatter(out_file, string_return, 0)
+
+    def _yield_windows(self):
+        a_window = []
+        for a_line in self._parser.stream_lines():
+            a_window.append(a_line)
+            if len(a_window) == self._stream_window:
+                yield a_window
+                a_window = []
+        if len(a_window) > 0:
+            yield a_window
+
+    def _scan(self, look_for_mentions_func):
+        return self._scan_lines(lines=self._parser.yield_lines(),
+                                look_for_mentions_func=look_for_mentions_func)
+
+    def _scan_lines(self, lines, look_for_mentions_func):
         max_lenght = 0
         line_counter = 0
-        for a_line in self._parser.yield_lines():
+        for a_line in lines:
             if not self._parser.is_prefix_line(a_line):
                 max_lenght = len(a_line) if len(a_line) > max_lenght else max_lenght
+            self._save_namespaces(a_line)
             self._save_mentions(line_number=line_counter,
                                 mentions=look_for_mentions_func(a_line))
             line_counter += 1
+        self._stats.lines_scanned += line_counter
+        return max_lenght
+
+    def _incremental_annotate(self, out_file, string_return, target):
+        plan = self._plan_incremental(out_file=out_file,
+                                      target=target)
+        if plan is None:
+            return self._skipped_result(out_file=out_file,
+                                        string_return=string_return)
+        with self._stats.phase(PHASE_RESOLVE):
+            self._solve_mentions()
+        with self._stats.phase(PHASE_OUTPUT):
+            return self._write_incremental(out_file=out_file,
+                                           string_return=string_return,
+                                           plan=plan)
+
+    def _plan_incremental(self, out_file, target):
+        # It returns None if the previous output is up to date. Otherwise, the content is scanned and
+        # it returns what _write_incremental needs: (settings, input digest, line digests, max length)
+        self._set_up(out_file)
+        settings = self._manifest_settings(target)
+        manifest = AnnotationManifest.load(out_file=out_file,
+                                           settings=settings) if _is_out_path(out_file) else None
+        input_digest = self._input_digest()
+        if manifest is not None and manifest.is_up_to_date(input_digest=input_digest,
+                                                            out_file=out_file):
+            self._stats.skipped = True
+            return None
+
+        line_digests = {}
+        with self._stats.phase(PHASE_SCAN):
+            max_lenght = self._scan_annotated(look_for_mentions_func=self._choose_mentions_finder(target),
+                                              manifest=manifest,
+                                              line_digests=line_digests)
+        return settings, input_digest, line_digests, max_lenght
+
+    def _skipped_result(self, out_file, string_return):
+        return self._read_previous_result(out_file) if string_return else None
+
+    def _write_incremental(self, out_file, string_return, plan):
+        settings, input_digest, line_digests, max_lenght = plan
+        in_place = _is_out_path(out_file) and self._file_input is not None and \
+            os.path.abspath(out_file) == os.path.abspath(self._file_input)
+        written_file = self._temporary_sibling(out_file) if in_place else out_file
+        self._set_incremental_formatter(out_file=written_file,
+                                        string_return=string_return,
+                                        max_length=max_lenght + 2)
+        result = self._formatter.produce_result()
+        if in_place:
+            os.replace(written_file, out_file)
+        if _is_out_path(out_file):  # Manifests are stored next to a disk file
+            new_manifest = AnnotationManifest(settings=settings)
+            for line_number, mentions in self._mention_index.yield_line_mentions():
+                if any(a_mention in self._unsolved_ids for a_mention in mentions):
+                    new_manifest.mark_incomplete()  # Not recorded: its ids will be asked again next time
+                    continue
+                new_manifest.add_line(line_digest=line_digests[line_number],
+                                      labels={a_mention: self._ids_dict[a_mention] for a_mention in mentions})
+            new_manifest.save(out_file=out_file,
+                              input_digest=input_digest)
+        return result
 
-        self._set_formatter(out_file, string_return, max_lenght + 2)
-        self._solve_mentions()
-        return self._formatter.produce_result()
+    def _set_incremental_formatter(self, out_file, string_return, max_length):
+        self._formatter = self._build_formatter(out_file=out_file,
+                                                string_return=string_return,
+                                                parser=self._parser,
+                                                mention_index=self._mention_index,
+                                                namespaces_dict=self._namespaces,
+                                                max_length=max_length,
+                                                strip_own_annotations=True)
+
+    def _scan_annotated(self, look_for_mentions_func, manifest, line_digests):
+        # Like _scan, but ignoring the annotations already present in the lines. When the mentions
+        # of a line are the same ones it has annotated (or the ones recorded in the manifest for
+        # an identical line), its labels are reused. Labels written in the lines may have been chosen
+        # with other settings (languages, ...) or be placeholders of ids that could not be solved, so they
+        # are trusted just if the manifest of the previous output (same settings) recorded the line
+        max_lenght = 0
+        line_counter = 0
+        for a_line in self._parser.yield_lines():
+            a_line, inline_labels = _split_own_annotation(a_line)
+            rdfs_header = _RDFS_HEADER.match(a_line)
+            if rdfs_header is not None:
+                # Header added by a previous rdfs annotation. Some parsers (turtle) do not recognise it as a
+                # prefix declaration, so it is registered here to not add it again
+                self._namespaces[_RDFS_NAMESPACE] = rdfs_header.group("prefix")
+            elif not self._parser.is_prefix_line(a_line):
+                max_lenght = len(a_line) if len(a_line) > max_lenght else max_lenght
+            self._save_namespaces(a_line)
+            mentions = look_for_mentions_func(a_line)
+            if len(mentions) > 0:
+                line_digests[line_counter] = digest_of_line(a_line)
+                previous_labels = None if manifest is None else manifest.labels_of_line(line_digests[line_counter])
+                if previous_labels is not None and inline_labels is not None:
+                    previous_labels = inline_labels  # What is actually written in the line
+                if previous_labels is not None and previous_labels.keys() == mentions.keys():
+                    mentions = previous_labels  # Same order as in the previous output, so the line is not rewritten
+                    self._ids_dict.update(previous_labels)
+            self._save_mentions(line_number=line_counter,
+                                mentions=mentions)
+            line_counter += 1
+        self._stats.lines_scanned = line_counter
+        return max_lenght
+
+    def _manifest_settings(self, target):
+        return {"format": self._format,
+                "languages": self._languages_for_api,
+                "target": target,
+                "rdfs_comments": self._generate_rdfs_comments,
+                "column_aligned": self._mode_column_aligned,
+                "alignment_block_lines": self._alignment_block_lines}
+
+    def _input_digest(self):
+        if self._raw_input is not None:
+            return digest_of_str(self._raw_input)
+        return digest_of_file(self._file_input)
+
+    def _read_previous_result(self, out_file):
+        with open(out_file, encoding="utf-8") as in_stream:
+            result = in_stream.read()
+        return result[:-1] if result.endswith("\n") else result  # Each written line ends with "\n"
+
+    def _temporary_sibling(self, a_path):
+        file_descriptor, result = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(a_path)),
+                                                   suffix=".tmp")
+        os.close(file_descriptor)
+        return result
 
     def _look_for_all_mentions(self, line):
-        entity_mentions = self._look_for_entity_mentions(line)
-        prop_mentions = self._look_for_prop_mentions(line)
-        return entity_mentions.union(prop_mentions)
+        return self._all_scanner.find_mentions(line)
 
     def _set_formatter(self, out_file, string_return, max_length):
+        self._formatter = self._build_formatter(out_file=out_file,
+                                                string_return=string_return,
+                                                parser=self._parser,
+                                                mention_index=self._mention_index,
+                                                namespaces_dict=self._namespaces,
+                                                max_length=max_length)
+
+    def _build_formatter(self, out_file, string_return, parser, mention_index, namespaces_dict, max_length,
+                         strip_own_annotations=False):
         if self._generate_rdfs_comments:
-            self._formatter = RdfsCommentFormatter(out_file=out_file,
-                                                   string_return=string_return,
-                                                   parser=self._parser,
-                                                   line_mentions_dict=self._line_mentions_dict,
-                                                   chars_till_comment=max_length,
-                                                   ids_dict=self._ids_dict,
-                                                   namespaces_dict=self._namespaces,
-                                                   mode_column_aligned=self._mode_column_aligned)
+            result = RdfsCommentFormatter(out_file=out_file,
+                                          string_return=string_return,
+                                          parser=parser,
+                                          mention_index=mention_index,
+                                          chars_till_comment=max_length,
+                                          ids_dict=self._ids_dict,
+                                          namespaces_dict=namespaces_dict,
+                                          mode_column_aligned=self._mode_column_aligned,
+                                          strip_own_annotations=strip_own_annotations,
+                                          alignment_block_lines=self._alignment_block_lines)
         else:
-            self._formatter = RawCommentsFormatter(out_file=out_file,
-                                                   string_return=string_return,
-                                                   parser=self._parser,
-                                                   line_mentions_dict=self._line_mentions_dict,
-                                                   chars_till_comment=max_length,
-                                                   ids_dict=self._ids_dict,
-                                                   mode_column_aligned=self._mode_column_aligned)
-        self._formatter.set_up()
+            result = RawCommentsFormatter(out_file=out_file,
+                                          string_return=string_return,
+                                          parser=parser,
+                                          mention_index=mention_index,
+                                          chars_till_comment=max_length,
+                                          ids_dict=self._ids_dict,
+                                          mode_column_aligned=self._mode_column_aligned,
+                                          strip_own_annotations=strip_own_annotations,
+                                          alignment_block_lines=self._alignment_block_lines)
+        result.set_up()
+        return result
 
     def _solve_mentions(self):
-        m_count = 0
-        curr_group = []
-        for a_mention in self._ids_dict:
-            curr_group.append(a_mention)
-            m_count += 1
-            if m_count % _MAX_IDS_PER_API_CALL == 0:
-                self._entities_api_call(curr_group)
-                curr_group = []
-        if len(curr_group) > 0:
-            self._entities_api_call(curr_group)
+        unsolved = self._unsolved_mentions()
+        self._save_labels(ids=unsolved,
+                          labels=self._resolver_chain.get_labels(ids=unsolved,
+                                                                 languages=self._languages,
+                                                                 stats=self._stats))
+
+    async def _solve_mentions_async(self, api_client):
+        unsolved = self._unsolved_mentions()
+        self._save_labels(ids=unsolved,
+                          labels=await self._resolver_chain.get_labels_async(ids=unsolved,
+                                                                             languages=self._languages,
+                                                                             stats=self._stats,
+                                                                             async_api_client=api_client))
+
+    def _unsolved_mentions(self):
+        result = [a_mention for a_mention, a_label in self._ids_dict.items() if a_label is None]
+        if self._stream_window is None:  # Streaming mode counts them in _yield_solved_windows
+            self._stats.distinct_ids += len(self._ids_dict)
+        self._stats.labels_reused += len(self._ids_dict) - len(result)
+        return result
+
+    def _solve_mentions_in_languages(self, languages_chains):
+        # Tiers solve every chain at a time (the wikidata API tier asks for all their languages in the same
+        # requests). It returns an ids dict per chain
+        unsolved = self._unsolved_mentions()
+        labels_by_chain = self._resolver_chain.get_labels_in_languages(ids=unsolved,
+                                                                       languages_chains=languages_chains,
+                                                                       stats=self._stats)
+        self._stats.record_unsolved([an_id for an_id in unsolved
+                                     if any(an_id not in labels for labels in labels_by_chain)])
+        return [{an_id: labels.get(an_id, NO_LABEL) for an_id in unsolved} for labels in labels_by_chain]
+
+    def _save_labels(self, ids, labels):
+        # Ids the API kept failing for are not cached, so they will be asked again next time
+        unsolved = [an_id for an_id in ids if an_id not in labels]
+        self._unsolved_ids.update(unsolved)
+        self._stats.record_unsolved(unsolved)
+        for an_id in ids:
+            self._ids_dict[an_id] = labels.get(an_id, NO_LABEL)
+
+    def _build_resolver_chain(self, cache_file, cache_ttl, cache_max_entries, label_index, property_snapshot):
+        # Fastest tiers first. The label index has every entity, so the tiers after it are not asked
+        tiers = []
+        if property_snapshot is not None:
+            tiers.append(PropertySnapshotResolver(self._open_property_snapshot(property_snapshot)))
+        if label_index is not None:
+            tiers.append(LabelIndexResolver(self._open_label_index(label_index)))
+        self._cache = LabelCache(path=cache_file,
+                                 ttl=cache_ttl,
+                                 max_entries=cache_max_entries)
+        tiers.append(CacheResolver(self._cache))
+        tiers.append(WikidataApiResolver(WikidataApiClient(api_url=self._api_url,
+                                                           max_concurrent_calls=self._max_concurrent_calls,
+                                                           max_retries=self._api_max_retries,
+                                                           maxlag=self._api_maxlag)))
+        return ResolverChain(tiers)
+
+    def _open_label_index(self, index_path):
+        if index_path is None:
+            return None
+        result = LabelIndex(index_path)
+        if result.languages_key != self._languages_for_api:
+            result.close()
+            raise ValueError("The label index {} was built for the languages {}, but {} were requested".format(
+                index_path, result.languages_key, self._languages_for_api))
+        return result
+
+    def _open_property_snapshot(self, snapshot_path):
+        if snapshot_path is None:
+            return None
+        result = PropertySnapshot(snapshot_path)
+        if not result.covers(self._languages):
+            missing_languages = [a_language for a_language in self._languages_for_api.split("|")
+                                 if a_language not in result.languages]
+            result.close()
+            raise ValueError("The property snapshot {} does not include the languages {}".format(
+                snapshot_path, missing_languages))
+        return result
 
     def _save_mentions(self, line_number, mentions):
         if len(mentions) > 0:
-            self._line_mentions_dict[line_number] = mentions
+            self._stats.mentions_found += len(mentions)
+            self._mention_index.add_line(line_number=line_number,
+                                         mentions=mentions)
             for a_mention in mentions:
                 if a_mention not in self._ids_dict:
                     self._ids_dict[a_mention] = None
@@ -405,112 +1509,108 @@ class WLighter(object):
         self._out_stream = None
 
     def _build_languages_for_api(self):
-        if len(self._languages) == 0:
-            return "en"
-        result = "|".join(self._languages)
-        if "en" in self._languages:
-            return result
-        else:
-            return result + "|en"
-
-    def _entities_api_call(self, entity_goup):
-        response = requests.get(_ENTITIES_API_CALL.format("|".join(entity_goup),
-                                                          self._languages_for_api))
-        response = response.json()
-        for an_entity in entity_goup:
-            self._ids_dict[an_entity] = \
-                self._get_label_from_json_result(labels_entity_json=
-                                                 response["entities"][an_entity]["labels"])
-
-    def _get_label_from_json_result(self, labels_entity_json):
-        for a_language in self._languages:
-            if a_language in labels_entity_json:
-                return labels_entity_json[a_language]["value"]
-        if "en" in labels_entity_json:
-            return labels_entity_json["en"]["value"]
-        return _NO_LABEL
+        return build_languages_for_api(self._languages)
 
     def _set_up(self, out_file):
-        if self._file_input is not None and self._file_input == out_file:
-            raise ValueError("Please, do not use the same disk path as input and output at a time")
-        self._line_mentions_dict = {}
+        self._check_out_file(out_file)
+        self._mention_index = MentionIndex()
         self._ids_dict = {}
-        self._look_for_namespaces()
+        self._unsolved_ids = set()
+        self._namespaces = {}
+        self._formatter = None
+        self._stats = AnnotationStats(hook=self._stats_hook)
+        self._reset_patterns()
         self._compile_patterns()
 
+    def _check_out_file(self, out_file):
+        if self._file_input is not None and self._file_input == out_file and not self._incremental:
+            raise ValueError("Please, do not use the same disk path as input and output at a time")
+
     def _look_for_entity_mentions(self, a_line):
-        full_mentions = re.findall(self._entity_full_pattern, a_line)
-        if len(full_mentions) != 0:
-            full_mentions = self._extract_id_from_full_uris(id_type="Q",
-                                                            mentions_list=full_mentions)
-        if self._entity_prefixed_pattern is not None:
-            prefixed_mentions = re.findall(self._entity_prefixed_pattern, a_line)
-            if len(prefixed_mentions) != 0:
-                prefixed_mentions = self._extract_id_from_prefixed_uris(id_type="Q",
-                                                                        mentions_list=prefixed_mentions)
-            return set(full_mentions + prefixed_mentions)
-        return set(full_mentions)
+        return self._entity_scanner.find_mentions(a_line)
 
     def _look_for_prop_mentions(self, a_line):
-        full_mentions = re.findall(self._prop_direct_full_pattern, a_line)
-        full_mentions += re.findall(self._prop_indirect_full_pattern, a_line)
-        if len(full_mentions) != 0:
-            full_mentions = self._extract_id_from_full_uris(id_type="P",
-                                                            mentions_list=full_mentions)
-
-        prefixed_mentions = []
-        if self._prop_direct_prefixed_pattern is not None:
-            prefixed_mentions += re.findall(self._prop_direct_prefixed_pattern, a_line)
-        if self._prop_indirect_prefixed_pattern is not None:
-            prefixed_mentions += re.findall(self._prop_indirect_prefixed_pattern, a_line)
-        if len(prefixed_mentions) != 0:
-            prefixed_mentions = self._extract_id_from_prefixed_uris(id_type="P",
-                                                                    mentions_list=prefixed_mentions)
-
-        return set(full_mentions + prefixed_mentions)
-
-    def _extract_id_from_full_uris(self, id_type, mentions_list):
-        result = []
-        for a_mention in mentions_list:
-            a_mention = a_mention.strip()
-            result.append(a_mention[a_mention.rfind(id_type):-1])
-        return result
+        return self._prop_scanner.find_mentions(a_line)
 
-    def _extract_id_from_prefixed_uris(self, id_type, mentions_list):
-        result = []
-        for a_mention in mentions_list:
-            a_mention = a_mention.strip()
-            if a_mention[-1] in _CLOSING_MENTION_CHARS:
-                a_mention = a_mention[:-1]
-            result.append(a_mention[a_mention.rfind(id_type):])
+    def _compile_patterns(self):
+        if self._entity_scanner is None:  # It should mean the rest are None too
+            entity_alternatives = self._mention_alternatives(group_name="entity",
+                                                             namespace=self._namespace_entities,
+                                                             id_type="Q")
+            prop_alternatives = self._mention_alternatives(group_name="direct",
+                                                           namespace=self._namespace_direct_prop,
+                                                           id_type="P") + \
+                                self._mention_alternatives(group_name="indirect",
+                                                           namespace=self._namespace_indirect_prop,
+                                                           id_type="P")
+            self._entity_scanner = _scanner_of(tuple(entity_alternatives))
+            self._prop_scanner = _scanner_of(tuple(prop_alternatives))
+            self._all_scanner = _scanner_of(tuple(entity_alternatives + prop_alternatives))
+
+    def _mention_alternatives(self, group_name, namespace, id_type):
+        # e.g. <http://www.wikidata.org/entity/Q42>  and, if some prefix is bound to that namespace,  wd:Q42
+        result = [("<" + re.escape(namespace) + "(?P<" + group_name + "_full>" + id_type + "[0-9]+)>",
+                   "<" + namespace)]
+        if namespace in self._namespaces:
+            prefix = self._namespaces[namespace]
+            result.append((_OPENING_MENTION_CONTEXT + re.escape(prefix) + ":(?P<" + group_name + "_prefixed>" +
+                           id_type + "[0-9]+)" + _CLOSING_MENTION_CONTEXT,
+                           prefix + ":"))
         return result
 
-    def _compile_patterns(self):
-        # re.compile('(?:^| |\\(|\\[)wd:Q[0-9]+[ ?*+;,.)\\]]')
-        if self._entity_full_pattern is None:  # It should mean the rest are None too
-            self._entity_full_pattern = re.compile("<" + self._namespace_entities + "Q[0-9]+" + ">")
-            self._entity_prefixed_pattern = None if self._namespace_entities not in self._namespaces else \
-                re.compile("(?:^| |\(|\[)" + self._namespaces[self._namespace_entities] + ":Q[0-9]+[ ?*+;,.)\]]")
-
-            self._prop_direct_full_pattern = re.compile("<" + self._namespace_direct_prop + "P[0-9]+" + ">")
-            self._prop_direct_prefixed_pattern = None if self._namespace_direct_prop not in self._namespaces else \
-                re.compile("(?:^| |\(|\[)" + self._namespaces[self._namespace_direct_prop] + ":P[0-9]+[ ?*+;,.)\]]")
-
-            self._prop_indirect_full_pattern = re.compile("<" + self._namespace_indirect_prop + "P[0-9]+" + ">")
-            self._prop_indirect_prefixed_pattern = None if self._namespace_indirect_prop not in self._namespaces else \
-                re.compile("(?:^| |\(|\[)" + self._namespaces[self._namespace_indirect_prop] + ":P[0-9]+[ ?*+;,.)\]]")
-
-    def _look_for_namespaces(self):
-        if self._namespaces is None:
-            self._namespaces = {}
-            for a_prefix, a_namespace in self._parser.yield_prefix_namespace_pairs():
+    def _save_namespaces(self, a_line):
+        # Prefixes must be declared before being used, so the patterns can be updated on the fly
+        for a_prefix, a_namespace in self._parser.yield_prefix_namespace_pairs_in_line(a_line):
+            if self._namespaces.get(a_namespace) != a_prefix:
                 self._namespaces[a_namespace] = a_prefix
-
-    def _choose_parser(self):
+                if a_namespace in (self._namespace_entities,
+                                   self._namespace_direct_prop,
+                                   self._namespace_indirect_prop):
+                    self._reset_patterns()
+                    self._compile_patterns()
+
+    def _reset_patterns(self):
+        self._entity_scanner = None
+        self._prop_scanner = None
+        self._all_scanner = None
+
+    def _choose_parser(self, raw_input, file_input, stream_input=None):
         if self._format == SHEXC_FORMAT:
-            return ShExCToyParser(raw_input=self._raw_input,
-                                  file_input=self._file_input)
+            return ShExCToyParser(raw_input=raw_input,
+                                  file_input=file_input,
+                                  stream_input=stream_input)
         elif self._format == TURTLE_FORMAT:
-            return TurtleToyParser(raw_input=self._raw_input,
-                                   file_input=self._file_input)
+            return TurtleToyParser(raw_input=raw_input,
+                                   file_input=file_input,
+                                   stream_input=stream_input)
+        elif self._format == NTRIPLES_FORMAT:
+            return NTriplesToyParser(raw_input=raw_input,
+                                     file_input=file_input,
+                                     stream_input=stream_input)
         raise ValueError("Unsupported format: " + self._format)
+
+
+def _scan_file_for_batch(file_input, format, languages, target):
+    # Module level function, so it can be sent to the processes of a pool
+    return WLighter(file_input=file_input,
+                    format=format,
+                    languages=languages)._scan_for_batch(target)
+
+
+def _write_file_for_batch(file_input, out_file, settings, mention_index, namespaces, max_length, labels):
+    # Module level function, so it can be sent to the processes of a pool
+    return WLighter(file_input=file_input,
+                    **settings)._write_for_batch(out_file, mention_index, namespaces, max_length, labels)
+
+
+def _scan_file_range(file_input, format, languages, target, start, end, namespaces):
+    # Module level function, so it can be sent to the processes of a pool
+    return WLighter(file_input=file_input,
+                    format=format,
+                    languages=languages)._scan_range(target, start, end, namespaces)
+
+
+async def _run_in_thread(func, **kwargs):
+    # Blocking work (disk, sqlite, CPU bound scans) runs in the default executor of the loop
+    import asyncio  # Not imported at module level: it is slow to import and just the async API needs it
+    return await asyncio.get_running_loop().run_in_executor(None, functools.partial(func, **kwargs))
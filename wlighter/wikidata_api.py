@@ -0,0 +1,542 @@
+import json
+import random
+import threading
+import time
+from collections import deque
+
+# requests, asyncio, aiohttp, concurrent.futures and email.utils are imported when first needed: they take
+# longer to import than the rest of the package, and many executions (cached or offline labels, command line
+# calls) never use them
+
+####### CONSTS
+
+WIKIDATA_API = "https://www.wikidata.org/w/api.php"
+DEFAULT_MAX_CONCURRENT_CALLS = 4  # Wikimedia asks clients to be gentle. Do not go crazy with this number
+DEFAULT_MAX_RETRIES = 5
+DEFAULT_MAX_CONSECUTIVE_FAILURES = 10
+DEFAULT_MAXLAG = 5  # Seconds. See https://www.mediawiki.org/wiki/Manual:Maxlag_parameter
+DEFAULT_TIMEOUT = 30
+
+###### PRIVATE MEMBERS
+
+_MAX_IDS_PER_API_CALL = 49
+_MIN_IDS_PER_API_CALL = 1
+_BATCH_SIZE_STEP = 8
+_TARGET_LATENCY = 2.0  # Seconds. Slower answers make batches smaller
+
+_BASE_BACKOFF = 0.5
+_MAX_BACKOFF = 60.0
+_MIN_THROTTLED_INTERVAL = 0.1
+_MAX_INTERVAL = 10.0
+_DEFAULT_RETRY_AFTER = 5.0
+
+_PROPERTY_NAMESPACE = 120
+_TOO_MANY_REQUESTS_STATUS = 429
+_UNAVAILABLE_STATUS = 503  # Throttling if it comes with Retry-After. An outage otherwise
+_GATEWAY_TIMEOUT_STATUS = 504
+_USER_AGENT = "wLighter (https://github.com/DaniFdezAlvarez/wLighter)"
+
+
+class _ApiCallFailed(Exception):
+
+    def __init__(self, reason, throttled=False, retry_after=None, too_slow=False, outage=False, rejected=False):
+        super().__init__(reason)
+        self.reason = reason
+        self.throttled = throttled  # The API asks us to slow down. Not a failure of the ids requested
+        self.retry_after = retry_after
+        self.too_slow = too_slow  # The answer took too long (timeouts): smaller batches may help
+        self.outage = outage  # No usable answer (connection errors, 5xx...): the API may be down
+        self.rejected = rejected  # The API answered with an error, which may be caused by some id of the batch
+
+
+class _AdaptiveScheduler(object):
+    """
+    Shared by the threads solving a group of ids. It decides the size of the next batch and when the
+    next request can be sent. Batches grow and requests get closer while the API answers fast, and
+    both are reduced when it answers slowly or times out. Failures and requests to slow down (429, 503
+    with Retry-After, maxlag) pause the requests. After max_consecutive_failures outages in a row
+    (connection errors, 5xx answers...), it gives up. Throttled answers never make it give up.
+    """
+
+    def __init__(self, max_batch_size, max_consecutive_failures=None):
+        self._lock = threading.Lock()
+        self._max_batch_size = max_batch_size
+        self._max_consecutive_failures = max_consecutive_failures
+        self._consecutive_failures = 0
+        self._consecutive_throttles = 0
+        self._batch_size = max_batch_size
+        self._interval = 0.0  # Min seconds between the start of two consecutive requests
+        self._next_slot = 0.0
+        self._paused_until = 0.0
+        self._random = random.Random()
+
+    @property
+    def batch_size(self):
+        with self._lock:
+            return self._batch_size
+
+    @property
+    def gave_up(self):
+        with self._lock:
+            return self._max_consecutive_failures is not None and \
+                self._consecutive_failures >= self._max_consecutive_failures
+
+    def wait_turn(self):
+        delay = self.reserve_turn()
+        if delay > 0:
+            time.sleep(delay)
+
+    async def wait_turn_async(self):
+        import asyncio
+        delay = self.reserve_turn()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def reserve_turn(self):
+        """
+        It books the next slot to send a request.
+
+        :return: seconds to wait before sending it
+        """
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_slot, self._paused_until)
+            self._next_slot = start + self._interval
+        return start - now
+
+    def on_success(self, latency):
+        with self._lock:
+            self._consecutive_failures = 0
+            self._consecutive_throttles = 0
+            if latency <= _TARGET_LATENCY:
+                self._batch_size = min(self._max_batch_size, self._batch_size + _BATCH_SIZE_STEP)
+                self._interval = self._interval / 2 if self._interval > _MIN_THROTTLED_INTERVAL / 4 else 0.0
+            else:
+                self._batch_size = max(_MIN_IDS_PER_API_CALL, int(self._batch_size * 0.75))
+
+    def on_failure(self, failure, attempt):
+        """
+
+        :param failure: _ApiCallFailed
+        :param attempt: number of times the ids of the failed request have failed. Not used for throttled answers,
+                which are paused according to the throttled answers received in a row
+        """
+        with self._lock:
+            if failure.too_slow:  # Errors, outages or throttling are not solved by asking for fewer ids
+                self._batch_size = max(_MIN_IDS_PER_API_CALL, self._batch_size // 2)
+            if failure.throttled:
+                self._consecutive_throttles += 1
+                pause = self._backoff(self._consecutive_throttles)
+                self._interval = min(_MAX_INTERVAL, max(self._interval * 2, _MIN_THROTTLED_INTERVAL))
+                if failure.retry_after is not None:
+                    pause = max(pause, failure.retry_after)
+            else:
+                if failure.outage:
+                    self._consecutive_failures += 1
+                pause = self._backoff(attempt)
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+
+    def _backoff(self, attempt):
+        # Exponential, with jitter so that several clients do not retry in lockstep
+        ceiling = min(_MAX_BACKOFF, _BASE_BACKOFF * (2 ** attempt))
+        return ceiling / 2 + self._random.uniform(0, ceiling / 2)
+
+
+class WikidataApiClient(object):
+
+    def __init__(self, api_url=None, max_concurrent_calls=DEFAULT_MAX_CONCURRENT_CALLS,
+                 max_retries=DEFAULT_MAX_RETRIES, maxlag=DEFAULT_MAXLAG, timeout=DEFAULT_TIMEOUT,
+                 max_consecutive_failures=DEFAULT_MAX_CONSECUTIVE_FAILURES):
+        """
+
+        :param api_url: URL of the wikidata API (api.php). The public wikidata endpoint is used if None
+        :param max_concurrent_calls: max number of requests to the API running at a time
+        :param max_retries: max number of times the ids of a failed request are retried
+        :param max_consecutive_failures: number of failed requests in a row after which the API is considered
+                down, and the ids not solved yet are given up. None to only rely on max_retries
+        :param maxlag: value of the maxlag parameter sent to the API. None to not send it
+        :param timeout: seconds to wait for each answer of the API
+        """
+        if max_concurrent_calls < 1:
+            raise ValueError("max_concurrent_calls must be a positive integer")
+        self._api_url = WIKIDATA_API if api_url is None else api_url
+        self._max_concurrent_calls = max_concurrent_calls
+        self._max_retries = max_retries
+        self._max_consecutive_failures = max_consecutive_failures
+        self._maxlag = maxlag
+        self._timeout = timeout
+        self._session = None  # Built with the first request
+        self._session_lock = threading.Lock()
+
+    def get_labels_json(self, ids, languages_for_api, on_batch=None, on_failed_batch=None):
+        """
+        It asks wbgetentities for the labels of the received ids. The ids are grouped in batches, which are
+        sent concurrently reusing the connections of a single HTTP session. The size of the batches and the
+        pace of the requests adapt to the answers of the API. Throttled requests are paused and sent again.
+        The ids of a failed request are retried (up to max_retries times) without affecting the rest, and a
+        batch rejected by the API is split in halves, so a wrong id does not fail the rest of its batch. If
+        max_consecutive_failures requests find the API down in a row, the ids not solved yet are given up.
+
+        :param ids: list of wikidata ids (QXX or PXX)
+        :param languages_for_api: languages to ask for, in the API format ("es|fr|en")
+        :param on_batch: optional callable, called as on_batch(n_ids, seconds, n_bytes) after each request
+        :param on_failed_batch: optional callable, called as on_failed_batch(n_ids, seconds, reason) after
+                each failed request
+        :return: list of (id, labels json) pairs, following the order of ids. Ids that could not be solved
+                after every retry, or given up, are not included
+        """
+        if len(ids) == 0:
+            return []
+        scheduler = _AdaptiveScheduler(max_batch_size=_MAX_IDS_PER_API_CALL,
+                                       max_consecutive_failures=self._max_consecutive_failures)
+        pending = _PendingIds(ids)
+        solved = {}
+        lock = threading.Lock()
+
+        def solve_pending():
+            while True:
+                with lock:
+                    if pending.is_empty() or scheduler.gave_up:
+                        return
+                    batch = pending.take_batch(scheduler.batch_size)
+                scheduler.wait_turn()
+                if scheduler.gave_up:  # Another thread gave up while this one was waiting
+                    return
+                start = time.perf_counter()
+                try:
+                    batch_result, n_bytes = self._entities_api_call(batch, languages_for_api)
+                except _ApiCallFailed as failure:
+                    seconds = time.perf_counter() - start
+                    with lock:
+                        attempt = pending.put_back(batch, failure, self._max_retries)
+                    if attempt is not None:
+                        scheduler.on_failure(failure, attempt)
+                    if on_failed_batch is not None:
+                        on_failed_batch(len(batch), seconds, failure.reason)
+                    continue
+                seconds = time.perf_counter() - start
+                scheduler.on_success(seconds)
+                with lock:
+                    solved.update(batch_result)
+                if on_batch is not None:
+                    on_batch(len(batch), seconds, n_bytes)
+
+        n_workers = min(self._max_concurrent_calls, (len(ids) - 1) // _MAX_IDS_PER_API_CALL + 1)
+        if n_workers == 1:
+            solve_pending()
+        else:
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(max_workers=n_workers) as executor:
+                for a_future in [executor.submit(solve_pending) for _ in range(n_workers)]:
+                    a_future.result()
+        return [(an_id, solved[an_id]) for an_id in ids if an_id in solved]
+
+    def get_property_ids(self):
+        """
+        It lists every property of wikidata (pages of the Property namespace). Failed requests are
+        retried up to max_retries times.
+
+        :return: list of property ids (PXX), sorted by number
+        """
+        params = {"action": "query",
+                  "list": "allpages",
+                  "apnamespace": _PROPERTY_NAMESPACE,
+                  "aplimit": "max",
+                  "format": "json"}
+        if self._maxlag is not None:
+            params["maxlag"] = self._maxlag
+        scheduler = _AdaptiveScheduler(max_batch_size=1)
+        result = []
+        attempt = 0
+        while True:
+            scheduler.wait_turn()
+            try:
+                content = self._query_api_call(params)
+            except _ApiCallFailed as failure:
+                attempt += 0 if failure.throttled else 1
+                if attempt > self._max_retries:
+                    raise ValueError("The wikidata API kept failing while listing properties: " + failure.reason)
+                scheduler.on_failure(failure, attempt)
+                continue
+            attempt = 0
+            result.extend(a_page["title"].split(":")[-1] for a_page in content["query"]["allpages"])
+            if "continue" not in content:
+                return sorted(result, key=lambda an_id: int(an_id[1:]))
+            params.update(content["continue"])
+
+    def close(self):
+        if self._session is not None:
+            self._session.close()
+        self._session = None
+
+    def _query_api_call(self, params):
+        import requests
+        try:
+            response = self._get_session().get(self._api_url, params=params, timeout=self._timeout)
+        except requests.RequestException as e:
+            raise _ApiCallFailed(reason=type(e).__name__,
+                                 outage=True)
+        return _check_answer(status_code=response.status_code,
+                             headers=response.headers,
+                             body=response.content)
+
+    def _entities_api_call(self, entity_group, languages_for_api):
+        import requests
+        try:
+            response = self._get_session().get(self._api_url,
+                                         params=_api_params(entity_group, languages_for_api, self._maxlag),
+                                         timeout=self._timeout)
+        except requests.RequestException as e:
+            raise _ApiCallFailed(reason=type(e).__name__,
+                                 too_slow=isinstance(e, requests.ReadTimeout),
+                                 outage=True)
+        return _parse_answer(entity_group=entity_group,
+                             status_code=response.status_code,
+                             headers=response.headers,
+                             body=response.content)
+
+    def _get_session(self):
+        with self._session_lock:  # Several threads may send their first request at a time
+            if self._session is None:
+                self._session = self._build_session()
+            return self._session
+
+    def _build_session(self):
+        import requests
+        from requests.adapters import HTTPAdapter
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self._max_concurrent_calls)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers["User-Agent"] = _USER_AGENT
+        return session
+
+
+class AsyncWikidataApiClient(object):
+    """
+    asyncio counterpart of WikidataApiClient, based on aiohttp (pip install wlighter[async]). Batches are
+    sent as tasks of the running event loop, following the same adaptive policy. A single object can be
+    shared by every annotation running in a loop, so all of them reuse one pool of connections and
+    max_concurrent_calls bounds the requests sent by all of them together. Close it with aclose(), or use it
+    as an async context manager.
+    """
+
+    def __init__(self, api_url=None, max_concurrent_calls=DEFAULT_MAX_CONCURRENT_CALLS,
+                 max_retries=DEFAULT_MAX_RETRIES, maxlag=DEFAULT_MAXLAG, timeout=DEFAULT_TIMEOUT,
+                 max_consecutive_failures=DEFAULT_MAX_CONSECUTIVE_FAILURES):
+        """
+
+        :param api_url: URL of the wikidata API (api.php). The public wikidata endpoint is used if None
+        :param max_concurrent_calls: max number of requests to the API running at a time
+        :param max_retries: max number of times the ids of a failed request are retried
+        :param max_consecutive_failures: number of failed requests in a row after which the API is considered
+                down, and the ids not solved yet are given up. None to only rely on max_retries
+        :param maxlag: value of the maxlag parameter sent to the API. None to not send it
+        :param timeout: seconds to wait for each answer of the API
+        """
+        if max_concurrent_calls < 1:
+            raise ValueError("max_concurrent_calls must be a positive integer")
+        try:
+            import aiohttp
+        except ImportError:
+            raise ImportError("The async API of wLighter needs aiohttp. Install it with: pip install wlighter[async]")
+        self._aiohttp = aiohttp
+        self._api_url = WIKIDATA_API if api_url is None else api_url
+        self._max_concurrent_calls = max_concurrent_calls
+        self._max_retries = max_retries
+        self._max_consecutive_failures = max_consecutive_failures
+        self._maxlag = maxlag
+        self._timeout = timeout
+        self._session = None  # aiohttp sessions must be created inside a running loop
+
+    async def get_labels_json(self, ids, languages_for_api, on_batch=None, on_failed_batch=None):
+        """
+        Same as WikidataApiClient.get_labels_json, but without blocking the event loop.
+
+        :param ids: list of wikidata ids (QXX or PXX)
+        :param languages_for_api: languages to ask for, in the API format ("es|fr|en")
+        :param on_batch: optional callable, called as on_batch(n_ids, seconds, n_bytes) after each request
+        :param on_failed_batch: optional callable, called as on_failed_batch(n_ids, seconds, reason) after
+                each failed request
+        :return: list of (id, labels json) pairs, following the order of ids. Ids that could not be solved
+                after every retry, or given up, are not included
+        """
+        if len(ids) == 0:
+            return []
+        session = self._get_session()
+        scheduler = _AdaptiveScheduler(max_batch_size=_MAX_IDS_PER_API_CALL,
+                                       max_consecutive_failures=self._max_consecutive_failures)
+        pending = _PendingIds(ids)
+        solved = {}
+
+        async def solve_pending():
+            # Tasks of a single loop: no locks needed as long as there is no await between reads and writes
+            while not pending.is_empty() and not scheduler.gave_up:
+                batch = pending.take_batch(scheduler.batch_size)
+                await scheduler.wait_turn_async()
+                if scheduler.gave_up:  # Another task gave up while this one was waiting
+                    return
+                start = time.perf_counter()
+                try:
+                    batch_result, n_bytes = await self._entities_api_call(session, batch, languages_for_api)
+                except _ApiCallFailed as failure:
+                    seconds = time.perf_counter() - start
+                    attempt = pending.put_back(batch, failure, self._max_retries)
+                    if attempt is not None:
+                        scheduler.on_failure(failure, attempt)
+                    if on_failed_batch is not None:
+                        on_failed_batch(len(batch), seconds, failure.reason)
+                    continue
+                seconds = time.perf_counter() - start
+                scheduler.on_success(seconds)
+                solved.update(batch_result)
+                if on_batch is not None:
+                    on_batch(len(batch), seconds, n_bytes)
+
+        import asyncio
+        n_workers = min(self._max_concurrent_calls, (len(ids) - 1) // _MAX_IDS_PER_API_CALL + 1)
+        await asyncio.gather(*[solve_pending() for _ in range(n_workers)])
+        return [(an_id, solved[an_id]) for an_id in ids if an_id in solved]
+
+    async def aclose(self):
+        if self._session is not None:
+            await self._session.close()
+        self._session = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.aclose()
+
+    async def _entities_api_call(self, session, entity_group, languages_for_api):
+        import asyncio
+        try:
+            async with session.get(self._api_url,
+                                   params=_api_params(entity_group, languages_for_api, self._maxlag)) as response:
+                body = await response.read()
+        except (self._aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise _ApiCallFailed(reason=type(e).__name__,
+                                 too_slow=isinstance(e, asyncio.TimeoutError),
+                                 outage=True)
+        return _parse_answer(entity_group=entity_group,
+                             status_code=response.status,
+                             headers=response.headers,
+                             body=body)
+
+    def _get_session(self):
+        if self._session is None or self._session.closed:
+            aiohttp = self._aiohttp
+            self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self._max_concurrent_calls),
+                                                  timeout=aiohttp.ClientTimeout(total=self._timeout),
+                                                  headers={"User-Agent": _USER_AGENT})
+        return self._session
+
+
+class _PendingIds(object):
+    """
+    Ids waiting to be requested by the workers of a get_labels_json call. Not thread-safe.
+    """
+
+    def __init__(self, ids):
+        self._ids = deque(ids)
+        self._split_batches = deque()  # Halves of rejected batches, requested as they are
+        self._attempts = {}
+
+    def is_empty(self):
+        return len(self._ids) == 0 and len(self._split_batches) == 0
+
+    def take_batch(self, batch_size):
+        if len(self._split_batches) > 0:
+            return self._split_batches.popleft()
+        return [self._ids.popleft() for _ in range(min(batch_size, len(self._ids)))]
+
+    def put_back(self, batch, failure, max_retries):
+        """
+        It decides what to do with the ids of a failed request.
+
+        :return: number of times these ids have failed, or None if the failure does not count as such
+                (throttled answers and rejected batches)
+        """
+        if failure.throttled:  # Nothing wrong with the ids: they are sent again once the pause is over
+            self._ids.extendleft(reversed(batch))
+            return None
+        if failure.rejected:
+            # Some id of the batch may cause the error: each half is requested on its own. A single id
+            # rejected would be rejected again, so it is not retried
+            if len(batch) > 1:
+                half = len(batch) // 2
+                self._split_batches.extendleft([batch[half:], batch[:half]])
+            return None
+        attempt = max(self._attempts.get(an_id, 0) for an_id in batch) + 1
+        for an_id in batch:
+            self._attempts[an_id] = attempt
+        if attempt <= max_retries:
+            self._ids.extendleft(reversed(batch))
+        return attempt
+
+
+def _api_params(entity_group, languages_for_api, maxlag):
+    result = {"action": "wbgetentities",
+              "props": "labels",
+              "ids": "|".join(entity_group),
+              "languages": languages_for_api,
+              "format": "json"}
+    if maxlag is not None:
+        result["maxlag"] = maxlag
+    return result
+
+
+def _parse_answer(entity_group, status_code, headers, body):
+    # Shared by the sync and the async clients. It returns (id, labels json) pairs and the size of the body,
+    # or raises _ApiCallFailed
+    content = _check_answer(status_code=status_code,
+                            headers=headers,
+                            body=body)
+    entities = content.get("entities", {})
+    # Missing entities (deleted, for example) come without labels
+    return [(an_entity, entities.get(an_entity, {}).get("labels", {})) for an_entity in entity_group], len(body)
+
+
+def _check_answer(status_code, headers, body):
+    # It returns the JSON content of a successful answer, or raises _ApiCallFailed
+    retry_after = _retry_after(headers)
+    if status_code == _TOO_MANY_REQUESTS_STATUS or (status_code == _UNAVAILABLE_STATUS and retry_after is not None):
+        raise _ApiCallFailed(reason="HTTP " + str(status_code),
+                             throttled=True,
+                             retry_after=retry_after)
+    if status_code != 200:
+        raise _ApiCallFailed(reason="HTTP " + str(status_code),
+                             too_slow=status_code == _GATEWAY_TIMEOUT_STATUS,
+                             outage=status_code >= 500,
+                             rejected=status_code < 500)
+    try:
+        content = json.loads(body)
+    except ValueError:  # Error pages of proxies, truncated answers...
+        raise _ApiCallFailed(reason="invalid JSON",
+                             outage=True)
+    if "error" in content:
+        code = content["error"].get("code", "unknown")
+        if code == "maxlag":
+            raise _ApiCallFailed(reason=code,
+                                 throttled=True,
+                                 retry_after=_DEFAULT_RETRY_AFTER if retry_after is None else retry_after)
+        raise _ApiCallFailed(reason=code,
+                             rejected=True)
+    return content
+
+
+def _retry_after(headers, default=None):
+    # Retry-After may be a number of seconds or an HTTP date
+    value = headers.get("Retry-After")
+    if value is None:
+        return default
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    from email.utils import parsedate_to_datetime
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return default